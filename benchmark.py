@@ -0,0 +1,276 @@
+"""
+HardLinker Benchmark Suite
+Measures scan and link throughput on a real folder
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from hashing import (
+    CACHE_POLICIES, MAX_BUFFER, available_digests, buffer_size_for, hash_file, hash_mapped, hash_tree,
+    new_hasher
+)
+from linker import DURABILITY_LEVELS, LinkEntry, LinkExecutor
+from pipeline import DuplicateFinder
+
+
+def run_scan(folder, **kwargs):
+    """Run one full scan and return (seconds, finder, groups)"""
+    finder = DuplicateFinder(**kwargs)
+    start = time.perf_counter()
+    groups = finder.run(folder)
+    return time.perf_counter() - start, finder, groups
+
+
+def bench_backends(args):
+    """Compare the thread and process hashing backends"""
+    print(f"\n🔐 Hash backends on {args.folder}\n")
+    print(f"{'backend':<10}{'workers':>8}{'seconds':>10}{'checks':>10}{'checks/s':>11}{'groups':>8}")
+    for backend in ("thread", "process"):
+        seconds, finder, groups = run_scan(
+            args.folder,
+            hash_backend=backend,
+            hash_threads=args.workers,
+            batch_size=args.batch_size,
+            algorithm=args.algorithm
+        )
+        workers = args.workers or os.cpu_count()
+        rate = finder.checked / seconds if seconds else 0
+        print(f"{backend:<10}{workers:>8}{seconds:>10.2f}{finder.checked:>10}{rate:>11.0f}{len(groups):>8}")
+
+
+def bench_digests(args):
+    """Compare every available digest algorithm"""
+    print(f"\n🧮 Digest algorithms on {args.folder}\n")
+    print(f"{'algorithm':<10}{'seconds':>10}{'checks':>10}{'checks/s':>11}{'groups':>8}")
+    for algorithm in available_digests():
+        seconds, finder, groups = run_scan(args.folder, algorithm=algorithm)
+        rate = finder.checked / seconds if seconds else 0
+        print(f"{algorithm:<10}{seconds:>10.2f}{finder.checked:>10}{rate:>11.0f}{len(groups):>8}")
+
+
+def drop_page_cache():
+    """Ask the kernel to forget cached file pages, returning False without permission"""
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+def bench_hdd(args):
+    """Compare read throughput with and without physical-order reads"""
+    print(f"\n💽 Disk-order reads on {args.folder}\n")
+    if args.drop_caches and not drop_page_cache():
+        print("⚠️ Could not drop the page cache (needs root on Linux), results may be warm\n")
+    print(f"{'hdd_mode':<10}{'readers':>8}{'seconds':>10}{'MB read':>10}{'MB/s':>10}{'groups':>8}")
+    for mode in ("off", "on"):
+        if args.drop_caches:
+            drop_page_cache()
+        seconds, finder, groups = run_scan(
+            args.folder, hdd_mode=mode, readers_per_disk=args.readers
+        )
+        megabytes = finder.bytes_read / (1024 * 1024)
+        rate = megabytes / seconds if seconds else 0
+        print(f"{mode:<10}{args.readers:>8}{seconds:>10.2f}{megabytes:>10.1f}{rate:>10.1f}{len(groups):>8}")
+
+
+def page_cache_bytes():
+    """Bytes of file data the kernel holds in the page cache, or None off Linux"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("Cached:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def bench_cache(args):
+    """Compare how each read cache policy grows the page cache"""
+    print(f"\n🧹 Read cache policies on {args.folder}\n")
+    print(f"{'policy':<10}{'seconds':>10}{'MB/s':>10}{'cache +MB':>11}{'groups':>8}")
+    for policy in CACHE_POLICIES:
+        if args.drop_caches:
+            drop_page_cache()
+        before = page_cache_bytes()
+        seconds, finder, groups = run_scan(args.folder, cache_policy=policy)
+        after = page_cache_bytes()
+        rate = finder.bytes_read / (1024 * 1024) / seconds if seconds else 0
+        growth = "n/a" if before is None else f"{(after - before) / (1024 * 1024):.1f}"
+        print(f"{policy:<10}{seconds:>10.2f}{rate:>10.1f}{growth:>11}{len(groups):>8}")
+
+
+def read_copy_hash(path, algorithm, chunk_size=8192):
+    """Baseline: f.read() into a new bytes object per chunk"""
+    hasher = new_hasher(algorithm)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.digest()
+
+
+def bench_buffers(args):
+    """Compare read() copies against readinto buffers and mmap"""
+    size = os.path.getsize(args.file)
+    print(f"\n📖 Read strategies on {args.file} ({size / (1024 * 1024):.1f} MB, warm cache)\n")
+    print(f"{'strategy':<22}{'buffer':>10}{'seconds':>10}{'MB/s':>10}")
+
+    # Warm the page cache so only userspace overhead differs
+    hash_file(args.file, args.algorithm)
+
+    runs = [("read() 8 KB", 8192, read_copy_hash)]
+    for chunk_size in (65536, 1 << 20, 4 << 20, 16 << 20):
+        runs.append(("readinto", chunk_size, hash_file))
+    runs.append(("readinto adaptive", buffer_size_for(size), hash_file))
+    runs.append(("mmap", MAX_BUFFER, hash_mapped))
+
+    for name, chunk_size, func in runs:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            func(args.file, args.algorithm, chunk_size)
+        seconds = (time.perf_counter() - start) / args.repeat
+        rate = size / (1024 * 1024) / seconds if seconds else 0
+        print(f"{name:<22}{chunk_size // 1024:>8} K{seconds:>10.3f}{rate:>10.0f}")
+
+
+def bench_tree(args):
+    """Compare flat hashing of one file with tree hashing at several thread counts"""
+    size = os.path.getsize(args.file)
+    segment_size = args.segment_mb * 1024 * 1024
+    print(f"\n🌳 Tree hashing {args.file} ({size / (1024 * 1024):.1f} MB, {args.segment_mb} MB segments)\n")
+    print(f"{'mode':<10}{'threads':>8}{'seconds':>10}{'MB/s':>10}")
+
+    runs = [("flat", 1, lambda: hash_file(args.file, args.algorithm, buffer_size_for(size)))]
+    for threads in sorted({1, 2, 4, os.cpu_count() or 4}):
+        runs.append(("tree", threads, lambda threads=threads: hash_tree(
+            args.file, size, args.algorithm, segment_size, threads, buffer_size_for(size)
+        )))
+
+    for mode, threads, func in runs:
+        if args.drop_caches:
+            drop_page_cache()
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        rate = size / (1024 * 1024) / seconds if seconds else 0
+        print(f"{mode:<10}{threads:>8}{seconds:>10.2f}{rate:>10.0f}")
+
+
+def make_link_batches(root, dirs, files, size):
+    """Write one master and dirs x files copies of it, returning link batches for them"""
+    master = os.path.join(root, "master.bin")
+    data = os.urandom(size)
+    with open(master, "wb") as f:
+        f.write(data)
+    master_st = os.stat(master)
+    batches = []
+    for d in range(dirs):
+        directory = os.path.join(root, f"d{d}")
+        os.mkdir(directory)
+        entries = []
+        for n in range(files):
+            name = f"f{n}.bin"
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(data)
+            st = os.stat(os.path.join(directory, name))
+            entries.append(LinkEntry(
+                master, name, size, master_st.st_ino, master_st.st_mtime_ns, st.st_ino, st.st_mtime_ns
+            ))
+        batches.append((directory, entries))
+    return batches
+
+
+def bench_durability(args):
+    """Compare link throughput at each durability level"""
+    print(f"\n💾 Link durability in {args.folder} ({args.dirs} folders x {args.files} files)\n")
+    print(f"{'level':<10}{'workers':>8}{'seconds':>10}{'files/s':>10}{'fsyncs':>8}")
+    for level in DURABILITY_LEVELS:
+        root = tempfile.mkdtemp(prefix="hardlinker-bench-", dir=args.folder)
+        try:
+            batches = make_link_batches(root, args.dirs, args.files, args.size)
+            # Copies written above must not be flushed on the clock of the run
+            if hasattr(os, "sync"):
+                os.sync()
+            executor = LinkExecutor(workers=args.workers, durability=level, sync_every=args.sync_every)
+            start = time.perf_counter()
+            totals, _ = executor.run_batches(batches)
+            seconds = time.perf_counter() - start
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+        rate = totals.success / seconds if seconds else 0
+        print(f"{level:<10}{args.workers:>8}{seconds:>10.2f}{rate:>10.0f}{totals.syncs:>8}")
+
+
+def main():
+    """Parse arguments and run the selected benchmark"""
+    parser = argparse.ArgumentParser(description="HardLinker benchmark suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backends = commands.add_parser("backends", help="thread vs process hashing")
+    backends.add_argument("folder")
+    backends.add_argument("--workers", type=int, default=0)
+    backends.add_argument("--batch-size", type=int, default=32)
+    backends.add_argument("--algorithm", default="sha256", choices=available_digests())
+    backends.set_defaults(func=bench_backends)
+
+    digests = commands.add_parser("digests", help="compare digest algorithms")
+    digests.add_argument("folder")
+    digests.set_defaults(func=bench_digests)
+
+    buffers = commands.add_parser("buffers", help="read() vs readinto buffer sizes vs mmap")
+    buffers.add_argument("file")
+    buffers.add_argument("--algorithm", default="sha256", choices=available_digests())
+    buffers.add_argument("--repeat", type=int, default=3)
+    buffers.set_defaults(func=bench_buffers)
+
+    hdd = commands.add_parser("hdd", help="hash order by directory vs by disk position")
+    hdd.add_argument("folder")
+    hdd.add_argument("--readers", type=int, default=1)
+    hdd.add_argument("--drop-caches", action="store_true",
+                     help="drop the page cache before each run (Linux, root)")
+    hdd.set_defaults(func=bench_hdd)
+
+    cache = commands.add_parser("cache", help="page cache growth per read cache policy")
+    cache.add_argument("folder")
+    cache.add_argument("--drop-caches", action="store_true",
+                       help="drop the page cache before each run (Linux, root)")
+    cache.set_defaults(func=bench_cache)
+
+    tree = commands.add_parser("tree", help="flat vs parallel tree hashing of one file")
+    tree.add_argument("file")
+    tree.add_argument("--algorithm", default="sha256", choices=available_digests())
+    tree.add_argument("--segment-mb", type=int, default=64)
+    tree.add_argument("--drop-caches", action="store_true",
+                      help="drop the page cache before each run (Linux, root)")
+    tree.set_defaults(func=bench_tree)
+
+    durability = commands.add_parser("durability", help="link throughput per durability level")
+    durability.add_argument("folder", help="scratch folder on the filesystem to test")
+    durability.add_argument("--dirs", type=int, default=20)
+    durability.add_argument("--files", type=int, default=200)
+    durability.add_argument("--size", type=int, default=4096)
+    durability.add_argument("--workers", type=int, default=8)
+    durability.add_argument("--sync-every", type=int, default=256)
+    durability.set_defaults(func=bench_durability)
+
+    args = parser.parse_args()
+    print("=" * 70)
+    print("📊 HARDLINKER BENCHMARK")
+    print("=" * 70)
+    args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+HardLinker Run Control
+Cancel and pause shared by every worker of a scan or link run
+"""
+
+import multiprocessing
+
+# Worker processes are always spawned, as on Windows: forking the GUI would
+# copy its Tk and scan threads' locks mid-use into every worker. Anything
+# shared with the workers must come from this same context.
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class RunToken:
+    """Cancellation and pause flags that threads and worker processes check between chunks"""
+
+    def __init__(self):
+        # Events in shared memory, so hashing processes started with the
+        # token see the same flags as the GUI thread
+        self._cancelled = MP_CONTEXT.Event()
+        self._running = MP_CONTEXT.Event()
+        self._running.set()
+
+    def __call__(self):
+        """Wait while paused, then return whether the run was cancelled"""
+        # Usable anywhere a cancel_check callable is expected, so every
+        # existing cancellation point also becomes a pause point
+        self._running.wait()
+        return self._cancelled.is_set()
+
+    @property
+    def cancelled(self):
+        """Whether cancel() was called, without waiting on a pause"""
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        """Whether workers are currently held"""
+        return not self._running.is_set()
+
+    def cancel(self):
+        """Stop the run; paused workers wake up to see it"""
+        self._cancelled.set()
+        self._running.set()
+
+    def pause(self):
+        """Hold every worker at its next check, keeping its state"""
+        if not self._cancelled.is_set():
+            self._running.clear()
+
+    def resume(self):
+        """Let held workers continue from where they stopped"""
+        self._running.set()
+
+    def reset(self):
+        """Make the token usable for a new run"""
+        self._cancelled.clear()
+        self._running.set()
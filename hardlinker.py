@@ -5,16 +5,22 @@ Optimized for Windows 11 - English Version
 
 import os
 import sys
-import hashlib
 import customtkinter as ctk
 from pathlib import Path
 from tkinter import filedialog, messagebox
-from collections import defaultdict
 from typing import Dict, List, Set
 import threading
+import multiprocessing
 import time
 import webbrowser
 import settings
+from hashcache import CacheChain, open_hash_cache
+from journal import LinkJournal, discard_journal, pending_batches, recover_batches
+from linker import LinkExecutor, plan_directories
+from pipeline import DuplicateFinder
+from control import RunToken
+from throttle import Throttle
+from xattrcache import open_xattr_cache
 
 # CustomTkinter settings
 ctk.set_appearance_mode("dark")
@@ -59,6 +65,16 @@ class Colors:
     # Special colors
     ORANGE = "#f0a860"
 
+# Read speed limits offered in the UI, bytes per second
+SPEED_LIMITS = {
+    "Unlimited": 0,
+    "200 MB/s": 200 * 1024 * 1024,
+    "100 MB/s": 100 * 1024 * 1024,
+    "50 MB/s": 50 * 1024 * 1024,
+    "20 MB/s": 20 * 1024 * 1024,
+    "5 MB/s": 5 * 1024 * 1024,
+}
+
 # Constants - Font
 class Fonts:
     FAMILY = "Segoe UI"
@@ -125,10 +141,25 @@ class HardLinkerApp(ctk.CTk):
         # Variables
         self.selected_folder = None
         self.duplicate_groups = []
+        self.cross_device_candidates = 0
+        self.stage_eliminations = {}
+        self.digest_algorithm = None
+        self.cached_digests = 0
+        self.read_throughput = (0, 0.0)
         self.total_space_saved = 0
         self.scanning = False
         self.animation_running = False
-        self.cancel_requested = False
+        self.linking = False
+        self.recovering = False
+        # Checked between chunks by walker, hasher and linker workers alike
+        self.run_token = RunToken()
+        
+        # Shared with running scans and link runs so limits change live
+        options = settings.get_options()
+        self.throttle = Throttle(
+            options["throttle_bytes_per_second"],
+            options["throttle_files_per_second"]
+        )
         
         # Critical folders
         self.critical_folders = {
@@ -148,6 +179,9 @@ class HardLinkerApp(ctk.CTk):
         if settings.should_show_welcome():
             self.after(500, self.show_welcome_dialog)
         
+        # Repair and offer to resume a link run that never finished
+        self.after(1000, self.check_interrupted_links)
+        
     def show_welcome_dialog(self):
         """Show welcome dialog on first run"""
         welcome_window = ctk.CTkToplevel(self)
@@ -512,7 +546,39 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
             font=Fonts.get(10, "bold"),
             text_color=Colors.TEXT_GRAY
         )
-        self.progress_label.pack(pady=(0, Sizes.PADDING_MEDIUM))
+        self.progress_label.pack(pady=(0, Sizes.PADDING_SMALL))
+        
+        # Read speed limit, applied to a running scan straight away; a rate
+        # set in the settings file is offered under its own name
+        self.speed_limits = dict(SPEED_LIMITS)
+        configured = int(self.throttle.bytes.rate)
+        speed_choices = list(SPEED_LIMITS)
+        current_limit = next(
+            (name for name, rate in SPEED_LIMITS.items() if rate == configured),
+            None
+        )
+        if current_limit is None:
+            current_limit = f"{self.format_size(configured)}/s"
+            self.speed_limits[current_limit] = configured
+            # Fastest first after "Unlimited", like the fixed choices
+            position = next(
+                (index for index, name in enumerate(speed_choices)
+                 if 0 < SPEED_LIMITS[name] < configured),
+                len(speed_choices)
+            )
+            speed_choices.insert(position, current_limit)
+        self.speed_menu = ctk.CTkOptionMenu(
+            progress_frame,
+            values=speed_choices,
+            command=self.set_speed_limit,
+            font=Fonts.get(10, "bold"),
+            width=140,
+            fg_color=Colors.BG_PROGRESS,
+            button_color=Colors.BLUE,
+            button_hover_color=Colors.BLUE_HOVER
+        )
+        self.speed_menu.set(current_limit)
+        self.speed_menu.pack(pady=(0, Sizes.PADDING_MEDIUM))
         
         # Buttons
         button_frame = ctk.CTkFrame(self.main_container, fg_color="transparent")
@@ -550,6 +616,22 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
         )
         self.cancel_btn.pack(side="left", expand=True, fill="x", padx=(Sizes.PADDING_SMALL, Sizes.PADDING_SMALL))
         
+        self.pause_btn = ctk.CTkButton(
+            button_frame,
+            text="Pause",
+            command=self.toggle_pause,
+            font=Fonts.get(14, "bold"),
+            height=Sizes.BUTTON_HEIGHT,
+            width=Sizes.BUTTON_WIDTH,
+            corner_radius=Sizes.BUTTON_CORNER,
+            state="disabled",
+            fg_color=Colors.BLUE,
+            hover_color=Colors.BLUE_HOVER,
+            border_width=Sizes.BUTTON_BORDER,
+            border_color=Colors.BLUE_BORDER
+        )
+        self.pause_btn.pack(side="left", expand=True, fill="x", padx=(Sizes.PADDING_SMALL, Sizes.PADDING_SMALL))
+        
         self.hardlink_btn = ctk.CTkButton(
             button_frame,
             text="Create Hardlinks",
@@ -618,7 +700,8 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
         if folder:
             self.selected_folder = folder
             self.folder_label.configure(text=f"{folder}")
-            self.scan_btn.configure(state="normal")
+            if not self.recovering:
+                self.scan_btn.configure(state="normal")
             self.hardlink_btn.configure(state="disabled")
             self.duplicate_groups = []
             
@@ -706,13 +789,14 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
     
     def start_scan(self):
         """Start scanning"""
-        if not self.selected_folder or self.scanning:
+        if not self.selected_folder or self.scanning or self.recovering:
             return
         
         self.scanning = True
-        self.cancel_requested = False
+        self.run_token.reset()
         self.scan_btn.configure(state="disabled", text="⏳ Scanning")
         self.cancel_btn.configure(state="normal")
+        self.pause_btn.configure(state="normal", text="⏸️ Pause")
         self.hardlink_btn.configure(state="disabled")
         self.results_textbox.configure(state="normal")
         self.results_textbox.delete("1.0", "end")
@@ -724,111 +808,91 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
         scan_thread.start()
     
     def cancel_scan(self):
-        """Cancel scanning"""
-        if self.scanning:
-            self.cancel_requested = True
-            self.update_status("⏹️ Cancelling scan...")
+        """Cancel scanning or linking"""
+        if self.scanning or self.linking:
+            self.run_token.cancel()
+            self.update_status("⏹️ Cancelling scan..." if self.scanning else "⏹️ Cancelling...")
             self.update_status_icon("⏹️")
             self.cancel_btn.configure(state="disabled", text="⏹️ Cancelling...")
+            self.pause_btn.configure(state="disabled", text="⏸️ Pause")
+    
+    def toggle_pause(self):
+        """Hold or release every worker of the running scan or link run"""
+        if not (self.scanning or self.linking) or self.run_token.cancelled:
+            return
+        if self.run_token.paused:
+            self.run_token.resume()
+            self.pause_btn.configure(text="⏸️ Pause")
+            self.update_status_icon("🔍" if self.scanning else "⚡")
+        else:
+            # Workers stop at their next chunk and keep their place
+            self.run_token.pause()
+            self.pause_btn.configure(text="▶️ Resume")
+            self.update_status_icon("⏸️")
     
     def scan_folder(self):
         """Scan folder and find duplicate files"""
+        cache = None
         try:
-            # Collect files
-            self.update_status("Collecting files...")
+            # Walk, group by size and hash in one pass
+            self.update_status("Scanning and hashing files...")
             self.update_status_icon("🔍")
-            all_files = []
-            
-            for root, dirs, files in os.walk(self.selected_folder):
-                if self.cancel_requested:
-                    self.handle_scan_cancelled()
-                    return
-                
-                for file in files:
-                    filepath = os.path.join(root, file)
-                    try:
-                        if os.path.isfile(filepath):
-                            all_files.append(filepath)
-                    except (PermissionError, OSError):
-                        continue
-            
-            total_files = len(all_files)
-            self.update_progress_label(0, total_files)
-            
-            # Group by size
-            self.update_status("Grouping files by size...")
-            self.update_status_icon("📦")
-            size_groups = defaultdict(list)
-            
-            for idx, filepath in enumerate(all_files):
-                if self.cancel_requested:
-                    self.handle_scan_cancelled()
-                    return
-                
-                try:
-                    size = os.path.getsize(filepath)
-                    if size > 0:
-                        size_groups[size].append(filepath)
-                    
-                    if idx % 100 == 0:
-                        progress = (idx + 1) / total_files
-                        self.progress_bar.set(progress)
-                        self.update_progress_label(idx + 1, total_files)
-                except (PermissionError, OSError):
-                    continue
-            
-            # Hash comparison
-            self.update_status("Checking duplicates with hash...")
-            self.update_status_icon("🔐")
+            options = settings.get_options()
             self.duplicate_groups = []
-            hash_groups = defaultdict(list)
+            # Attributes travel with the files, so they are asked first
+            caches = []
+            if options["xattr_cache"]:
+                caches.append(open_xattr_cache())
+            if options["hash_cache"]:
+                caches.append(open_hash_cache(
+                    settings.get_hash_cache_path(),
+                    options["hash_cache_max_entries"]
+                ))
+            caches = [cache for cache in caches if cache is not None]
+            if len(caches) == 1:
+                cache = caches[0]
+            elif caches:
+                cache = CacheChain(caches)
             
-            checked_files = 0
-            files_to_check = [f for files in size_groups.values() if len(files) > 1 for f in files]
-            total_to_check = len(files_to_check)
+            finder = DuplicateFinder(
+                walker_threads=options["walker_threads"],
+                hash_threads=options["hash_threads"],
+                hash_backend=options["hash_backend"],
+                batch_size=options["hash_batch_size"],
+                algorithm=options["hash_algorithm"],
+                mmap_threshold=options["mmap_threshold"],
+                cache=cache,
+                cancel_check=self.run_token,
+                progress=self.update_hash_progress,
+                head_bytes=options["prehash_head_bytes"],
+                tail_bytes=options["prehash_tail_bytes"],
+                middle_samples=options["prehash_middle_samples"],
+                middle_bytes=options["prehash_middle_bytes"],
+                lockstep=options["lockstep"],
+                lockstep_min_size=options["lockstep_min_size"],
+                hdd_mode=options["hdd_mode"],
+                readers_per_disk=options["hdd_readers_per_disk"],
+                cache_policy=options["read_cache_policy"],
+                throttle=self.throttle,
+                nice=options["worker_nice"],
+                io_priority=options["worker_io_priority"],
+                tree_threshold=options["tree_hash_threshold"],
+                tree_segment_size=options["tree_segment_size"],
+                tree_threads=options["tree_hash_threads"]
+            )
+            groups = finder.run(self.selected_folder)
             
-            for size, file_list in size_groups.items():
-                if self.cancel_requested:
-                    self.handle_scan_cancelled()
-                    return
-                
-                if len(file_list) > 1:
-                    for filepath in file_list:
-                        if self.cancel_requested:
-                            self.handle_scan_cancelled()
-                            return
-                        
-                        try:
-                            file_hash = self.calculate_hash(filepath)
-                            hash_groups[file_hash].append(filepath)
-                            
-                            checked_files += 1
-                            if checked_files % 50 == 0:
-                                progress = checked_files / max(total_to_check, 1)
-                                self.progress_bar.set(progress)
-                                self.update_progress_label(checked_files, total_to_check)
-                        except (PermissionError, OSError, Exception):
-                            continue
+            if groups is None or self.run_token.cancelled:
+                self.handle_scan_cancelled()
+                return
             
-            # Filter duplicate groups
-            for file_hash, file_list in hash_groups.items():
-                if len(file_list) > 1:
-                    inodes = {}
-                    for filepath in file_list:
-                        try:
-                            stat = os.stat(filepath)
-                            inode = (stat.st_dev, stat.st_ino)
-                            if inode not in inodes:
-                                inodes[inode] = []
-                            inodes[inode].append(filepath)
-                        except (OSError, Exception):
-                            continue
-                    
-                    # Only add group if there are multiple unique inodes
-                    if len(inodes) > 1:
-                        unique_files = [files[0] for files in inodes.values()]
-                        if len(unique_files) > 1:
-                            self.duplicate_groups.append(unique_files)
+            self.duplicate_groups = groups
+            self.cross_device_candidates = finder.cross_device
+            self.stage_eliminations = finder.eliminated
+            self.digest_algorithm = finder.algorithm
+            self.cached_digests = finder.cached
+            self.read_throughput = (finder.bytes_read, finder.seconds)
+            self.update_hash_progress(finder.checked, finder.candidates)
             
             # Show results
             self.after(0, self.show_results)
@@ -837,10 +901,12 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
             self.update_status(f"❌ Error: {str(e)}")
             self.update_status_icon("❌")
         finally:
+            if cache is not None:
+                cache.close()
             self.scanning = False
-            self.cancel_requested = False
             self.scan_btn.configure(state="normal", text="🔍 Start Scan")
             self.cancel_btn.configure(state="disabled", text="⛔ Stop")
+            self.pause_btn.configure(state="disabled", text="⏸️ Pause")
             self.update_status_icon("✅")
             if self.duplicate_groups:
                 self.hardlink_btn.configure(state="normal")
@@ -860,17 +926,6 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
         self.progress_bar.set(0)
         self.duplicate_groups = []
     
-    def calculate_hash(self, filepath, chunk_size=8192):
-        """Calculate SHA256 hash of file"""
-        sha256 = hashlib.sha256()
-        with open(filepath, 'rb') as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                sha256.update(chunk)
-        return sha256.hexdigest()
-    
     def show_results(self):
         """Show scan results"""
         self.results_textbox.configure(state="normal")
@@ -881,6 +936,11 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
                 "Scan completed!\n\n"
                 "No duplicate files found. All your files are unique.\n"
             )
+            if self.cross_device_candidates:
+                self.results_textbox.insert("end",
+                    f"\n{self.cross_device_candidates} same-size files on other drives were skipped "
+                    f"(hardlinks cannot cross drives).\n"
+                )
             self.total_space_saved = 0
         else:
             # Calculate total space
@@ -888,13 +948,9 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
             total_files_to_link = 0
             
             for group in self.duplicate_groups:
-                try:
-                    size = os.path.getsize(group[0])
-                    space_saved = size * (len(group) - 1)
-                    self.total_space_saved += space_saved
-                    total_files_to_link += len(group) - 1
-                except (OSError, Exception):
-                    continue
+                space_saved = group[0].size * (len(group) - 1)
+                self.total_space_saved += space_saved
+                total_files_to_link += len(group) - 1
             
             # Insert summary ONCE at the beginning
             summary_text = (
@@ -902,15 +958,34 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
                 f"📊 Summary:\n"
                 f"  • {len(self.duplicate_groups)} duplicate file groups found\n"
                 f"  • {total_files_to_link} files will be hardlinked\n"
-                f"  • {self.format_size(self.total_space_saved)} disk space will be saved\n\n"
-                f"{'─' * 70}\n\n"
+                f"  • {self.format_size(self.total_space_saved)} disk space will be saved\n"
+                f"  • Content compared with {self.digest_algorithm}\n"
             )
+            bytes_read, seconds = self.read_throughput
+            if bytes_read and seconds:
+                summary_text += (
+                    f"  • Read {self.format_size(bytes_read)} at "
+                    f"{self.format_size(bytes_read / seconds)}/s\n"
+                )
+            if self.cached_digests:
+                summary_text += f"  • {self.cached_digests} checks answered from the hash cache\n"
+            if self.cross_device_candidates:
+                summary_text += (
+                    f"  • {self.cross_device_candidates} same-size files on other drives skipped "
+                    f"(hardlinks cannot cross drives)\n"
+                )
+            if self.stage_eliminations:
+                checks = ", ".join(
+                    f"{name} {count}" for name, count in self.stage_eliminations.items()
+                )
+                summary_text += f"  • Ruled out by content checks: {checks}\n"
+            summary_text += f"\n{'─' * 70}\n\n"
             self.results_textbox.insert("1.0", summary_text)
             
             # Group details
             for idx, group in enumerate(self.duplicate_groups[:50], 1):
                 try:
-                    size = os.path.getsize(group[0])
+                    size = group[0].size
                     space_saved = size * (len(group) - 1)
                     
                     group_text = (
@@ -921,8 +996,8 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
                     )
                     self.results_textbox.insert("end", group_text)
                     
-                    for filepath in group[:3]:
-                        self.results_textbox.insert("end", f"   📄 {filepath}\n")
+                    for record in group[:3]:
+                        self.results_textbox.insert("end", f"   📄 {record.path}\n")
                     
                     if len(group) > 3:
                         self.results_textbox.insert("end", f"   ... and {len(group) - 3} more files\n")
@@ -987,7 +1062,7 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
         
         for idx, group in enumerate(self.duplicate_groups[:30], 1):
             try:
-                size = os.path.getsize(group[0])
+                size = group[0].size
                 space_saved = size * (len(group) - 1)
                 details_textbox.insert("end", 
                     f"📦 Group {idx}:  "
@@ -995,10 +1070,10 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
                     f"Size: {self.format_size(size)}  |  "
                     f"Savings: {self.format_size(space_saved)}\n"
                 )
-                details_textbox.insert("end", f"   ✓ Master: {group[0]}\n")
+                details_textbox.insert("end", f"   ✓ Master: {group[0].path}\n")
                 details_textbox.insert("end", f"   → Will be hardlinked:\n")
-                for filepath in group[1:3]:
-                    details_textbox.insert("end", f"      {filepath}\n")
+                for record in group[1:3]:
+                    details_textbox.insert("end", f"      {record.path}\n")
                 if len(group) > 3:
                     details_textbox.insert("end", f"      ... and {len(group) - 3} more files\n")
                 details_textbox.insert("end", "\n")
@@ -1053,80 +1128,139 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
         )
         confirm_btn.pack(side="right", expand=True, padx=(10, 0))
     
-    def perform_hardlink(self):
+    def check_interrupted_links(self):
+        """Recover a link run cut short by a crash, off the GUI thread"""
+        journal_path = settings.get_link_journal_path()
+        if not os.path.exists(journal_path) or self.scanning or self.linking:
+            return
+        # Scanning and linking wait until the journal is dealt with, so a new
+        # run cannot replace it while it is being read
+        self.recovering = True
+        self.scan_btn.configure(state="disabled")
+        self.update_status("🔧 Checking the interrupted hardlink operation...")
+        recovery_thread = threading.Thread(
+            target=self.recover_interrupted_links, args=(journal_path,), daemon=True
+        )
+        recovery_thread.start()
+    
+    def recover_interrupted_links(self, journal_path):
+        """Repair half-made links from the journal, then ask about the rest"""
+        try:
+            batches = pending_batches(journal_path) or []
+            batches, forward, back = recover_batches(batches)
+        except Exception as e:
+            self.update_status(f"❌ Error: {str(e)}")
+            self.update_status_icon("❌")
+            self.after(0, self.finish_recovery)
+            return
+        self.after(0, lambda: self.offer_resume(journal_path, batches, forward, back))
+    
+    def finish_recovery(self):
+        """Allow scans and link runs again"""
+        self.recovering = False
+        if self.selected_folder:
+            self.scan_btn.configure(state="normal")
+    
+    def offer_resume(self, journal_path, batches, forward, back):
+        """Report the repair and offer to link what the interrupted run left"""
+        self.finish_recovery()
+        self.update_status("Scan not started")
+        if not batches:
+            discard_journal(journal_path)
+            if forward or back:
+                messagebox.showinfo(
+                    "Interrupted Operation Repaired",
+                    f"The last hardlink operation was interrupted.\n\n"
+                    f"Completed: {forward} files\n"
+                    f"Rolled back: {back} files\n\n"
+                    f"Nothing else was left to do."
+                )
+            return
+        files = sum(len(entries) for _, entries in batches)
+        resume = messagebox.askyesno(
+            "Resume Interrupted Operation",
+            f"The last hardlink operation was interrupted.\n\n"
+            f"Completed: {forward} files\n"
+            f"Rolled back: {back} files\n"
+            f"Remaining: {files} files in {len(batches)} folders\n\n"
+            f"Resume the operation now?"
+        )
+        if resume:
+            self.perform_hardlink(batches)
+        else:
+            discard_journal(journal_path)
+    
+    def perform_hardlink(self, batches=None):
         """Perform hardlink operation"""
-        self.cancel_requested = False
+        self.run_token.reset()
+        self.linking = True
         self.hardlink_btn.configure(state="disabled", text="⏳ Processing")
         self.scan_btn.configure(state="disabled")
         self.cancel_btn.configure(state="normal", text="⛔ Stop")
+        self.pause_btn.configure(state="normal", text="⏸️ Pause")
         
         # Run in thread
-        hardlink_thread = threading.Thread(target=self.do_hardlink, daemon=True)
+        hardlink_thread = threading.Thread(target=self.do_hardlink, args=(batches,), daemon=True)
         hardlink_thread.start()
     
-    def do_hardlink(self):
-        """Do hardlink operation"""
-        success_count = 0
-        fail_count = 0
-        total_saved = 0
-        total_groups = len(self.duplicate_groups)
+    def do_hardlink(self, batches=None):
+        """Do hardlink operation, or resume the given journaled batches"""
+        options = settings.get_options()
         
         self.update_status("⚡ Hardlink operation started...")
         
-        for idx, group in enumerate(self.duplicate_groups):
-            if self.cancel_requested:
-                self.update_status("⛔ Hardlink operation cancelled!")
-                self.show_completion_message(success_count, fail_count, total_saved, cancelled=True)
-                break
-            
+        def progress(done_files, total_files, totals):
+            self.progress_bar.set(done_files / max(total_files, 1))
+            self.update_status(f"⚡ Processing: {done_files}/{total_files} files")
+        
+        executor = LinkExecutor(
+            workers=options["link_workers"],
+            cancel_check=self.run_token,
+            throttle=self.throttle,
+            progress=progress,
+            durability=options["link_durability"],
+            sync_every=options["link_sync_every"]
+        )
+        journal = None
+        try:
+            if batches is None:
+                batches = list(plan_directories(self.duplicate_groups).items())
+            # Left behind only by a crash; a cancelled run is over and says so
+            journal = LinkJournal(settings.get_link_journal_path())
             try:
-                master_file = group[0]
-                
-                for duplicate_file in group[1:]:
-                    if self.cancel_requested:
-                        break
-                    
-                    try:
-                        backup_file = duplicate_file + ".backup_temp"
-                        os.rename(duplicate_file, backup_file)
-                        os.link(master_file, duplicate_file)
-                        os.remove(backup_file)
-                        
-                        size = os.path.getsize(master_file)
-                        total_saved += size
-                        success_count += 1
-                        
-                    except Exception as e:
-                        fail_count += 1
-                        try:
-                            if os.path.exists(backup_file):
-                                if os.path.exists(duplicate_file):
-                                    os.remove(duplicate_file)
-                                os.rename(backup_file, duplicate_file)
-                        except:
-                            pass
-                
-                progress = (idx + 1) / total_groups
-                self.progress_bar.set(progress)
-                self.update_status(f"⚡ Processing: {idx + 1}/{total_groups} groups")
-                
-            except Exception as e:
-                fail_count += 1
-                continue
-        
-        if not self.cancel_requested:
-            self.show_completion_message(success_count, fail_count, total_saved)
-        
-        self.hardlink_btn.configure(state="disabled", text="⚡ Create Hardlinks")
-        self.scan_btn.configure(state="normal")
-        self.cancel_btn.configure(state="disabled", text="⛔ Stop")
+                journal.begin(batches)
+            except OSError:
+                # An unwritable settings folder costs crash recovery, not the run
+                journal = None
+            totals, cancelled = executor.run_batches(batches, journal)
+            if journal is not None:
+                journal.close()
+            
+            if cancelled:
+                self.update_status("⛔ Hardlink operation cancelled!")
+                self.show_completion_message(totals.success, totals.failed, totals.saved, cancelled=True)
+                self.update_status("⛔ Operation cancelled!")
+                self.progress_bar.set(0)
+            else:
+                self.show_completion_message(totals.success, totals.failed, totals.saved)
+                self.update_status("Operation completed!")
+                self.progress_bar.set(1.0)
         
-        if not self.cancel_requested:
-            self.update_status("Operation completed!")
-            self.progress_bar.set(1.0)
-        else:
-            self.update_status("⛔ Operation cancelled!")
-            self.progress_bar.set(0)
+        except Exception as e:
+            # Keep the journal, e.g. when the disk filled up, so the run can be resumed
+            if journal is not None:
+                try:
+                    journal.close(finished=False)
+                except OSError:
+                    pass
+            self.update_status(f"❌ Error: {str(e)}")
+            self.update_status_icon("❌")
+        finally:
+            self.linking = False
+            self.hardlink_btn.configure(state="disabled", text="⚡ Create Hardlinks")
+            self.scan_btn.configure(state="normal")
+            self.cancel_btn.configure(state="disabled", text="⛔ Stop")
+            self.pause_btn.configure(state="disabled", text="⏸️ Pause")
     
     def show_completion_message(self, success, fail, saved, cancelled=False):
         """Show completion message"""
@@ -1149,6 +1283,12 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
             )
             self.after(0, lambda: messagebox.showinfo("Operation Completed", message))
     
+    def set_speed_limit(self, choice):
+        """Change the read speed limit, including for a scan in progress"""
+        rate = self.speed_limits[choice]
+        self.throttle.set_limits(bytes_per_second=rate)
+        settings.set_option("throttle_bytes_per_second", rate)
+    
     def update_status(self, text):
         """Update status message"""
         self.after(0, lambda: self.status_label.configure(text=text))
@@ -1163,6 +1303,11 @@ When you delete a hardlink, only that reference is deleted. The actual data is p
             text=f"📊 {current:,} / {total:,} files scanned"
         ))
     
+    def update_hash_progress(self, checked, candidates):
+        """Update progress bar and label from the scan pipeline"""
+        self.progress_bar.set(checked / max(candidates, 1))
+        self.update_progress_label(checked, candidates)
+    
     def update_stats(self):
         """Update statistics"""
         total_files = sum(len(group) for group in self.duplicate_groups)
@@ -1283,4 +1428,6 @@ def show_admin_warning_dialog(parent):
 
 
 if __name__ == "__main__":
+    # Needed for the process hashing backend in the frozen executable
+    multiprocessing.freeze_support()
     main()
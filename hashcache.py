@@ -0,0 +1,169 @@
+"""
+HardLinker Hash Cache
+Persistent digests so unchanged files are not read again on rescans
+"""
+
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    last_used INTEGER NOT NULL,
+    UNIQUE (dev, algorithm, stage, ino)
+);
+CREATE INDEX IF NOT EXISTS digests_last_used ON digests (last_used);
+"""
+
+
+def stage_id(name, ranges):
+    """Identify a stage check, including its sample ranges"""
+    # Sample sizes are configurable, so "head" alone would not say which bytes
+    if ranges is None:
+        return name
+    return name + ":" + ",".join(f"{offset}+{length}" for offset, length in ranges)
+
+
+class HashCache:
+    """SQLite digest cache keyed on (dev, ino, size, mtime_ns), algorithm and stage"""
+
+    def __init__(self, path, max_entries=2000000, flush_every=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.hits = 0
+        self._pending = []
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+
+    def lookup_bucket(self, dev, size, algorithm, stage, files):
+        """Return {ino: digest} for the (ino, mtime_ns, path) files of one bucket that are unchanged"""
+        # One query per bucket and stage instead of one per file
+        wanted = {ino: mtime_ns for ino, mtime_ns, path in files}
+        found = {}
+        used = []
+        inos = list(wanted)
+        try:
+            for start in range(0, len(inos), 500):
+                chunk = inos[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT rowid, ino, size, mtime_ns, digest FROM digests "
+                    f"WHERE dev = ? AND algorithm = ? AND stage = ? "
+                    f"AND ino IN ({','.join('?' * len(chunk))})",
+                    (dev, algorithm, stage, *chunk)
+                )
+                for rowid, ino, cached_size, mtime_ns, digest in rows:
+                    if cached_size == size and wanted.get(ino) == mtime_ns:
+                        found[ino] = digest
+                        used.append(rowid)
+            if used:
+                now = time.time_ns()
+                self._conn.executemany(
+                    "UPDATE digests SET last_used = ? WHERE rowid = ?",
+                    [(now, rowid) for rowid in used]
+                )
+        except sqlite3.Error:
+            # A locked or damaged cache only costs a rehash
+            return {}
+        self.hits += len(found)
+        return found
+
+    def store(self, dev, ino, size, mtime_ns, algorithm, stage, digest, path=None):
+        """Queue a digest to be written with the next batch"""
+        self._pending.append((dev, ino, size, mtime_ns, algorithm, stage, digest, time.time_ns()))
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write queued digests in one transaction"""
+        try:
+            if self._pending:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO digests "
+                    "(dev, ino, size, mtime_ns, algorithm, stage, digest, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._pending
+                )
+            self._conn.commit()
+        except sqlite3.Error:
+            pass
+        self._pending = []
+
+    def evict(self):
+        """Drop least recently used digests beyond the size limit"""
+        try:
+            count = self._conn.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM digests WHERE rowid IN "
+                    "(SELECT rowid FROM digests ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Flush, trim to the size limit and close the database"""
+        try:
+            self.flush()
+            self.evict()
+        finally:
+            self._conn.close()
+
+
+class CacheChain:
+    """Several digest caches asked in order, each digest stored in all of them"""
+
+    def __init__(self, caches):
+        self.caches = caches
+
+    @property
+    def hits(self):
+        """Digests answered by any of the caches"""
+        return sum(cache.hits for cache in self.caches)
+
+    @property
+    def unverified(self):
+        """(dev, ino) of hits from caches whose digests must be confirmed before linking"""
+        return set().union(*(getattr(cache, "unverified", ()) for cache in self.caches))
+
+    def lookup_bucket(self, dev, size, algorithm, stage, files):
+        """Return {ino: digest}, asking later caches only about the files still missing"""
+        found = {}
+        for cache in self.caches:
+            missing = [entry for entry in files if entry[0] not in found]
+            if not missing:
+                break
+            found.update(cache.lookup_bucket(dev, size, algorithm, stage, missing))
+        return found
+
+    def store(self, *args):
+        """Store a digest in every cache"""
+        for cache in self.caches:
+            cache.store(*args)
+
+    def flush(self):
+        """Flush every cache"""
+        for cache in self.caches:
+            cache.flush()
+
+    def close(self):
+        """Close every cache"""
+        for cache in self.caches:
+            cache.close()
+
+
+def open_hash_cache(path, max_entries=2000000):
+    """Open the hash cache, or return None if the database cannot be used"""
+    try:
+        return HashCache(path, max_entries)
+    except sqlite3.Error:
+        return None
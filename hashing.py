@@ -0,0 +1,748 @@
+"""
+HardLinker Hashing
+Content digests used to tell candidate files apart
+"""
+
+import errno
+import hashlib
+import mmap
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+
+from control import MP_CONTEXT, RunToken
+from throttle import lower_priority
+
+# Digest constructors by name, the optional ones only when installed
+DIGESTS = {
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+    "blake2s": hashlib.blake2s,
+}
+
+try:
+    import xxhash
+    DIGESTS["xxh3_64"] = xxhash.xxh3_64
+    DIGESTS["xxh128"] = xxhash.xxh3_128
+except ImportError:
+    pass
+
+try:
+    import blake3
+    DIGESTS["blake3"] = blake3.blake3
+except ImportError:
+    pass
+
+
+# Digests nobody can construct a collision for; a full-file match under any
+# other algorithm is confirmed byte by byte before it may lead to a link
+CRYPTOGRAPHIC_DIGESTS = {"sha256", "blake2b", "blake2s", "blake3"}
+
+
+class HashCancelled(Exception):
+    """Raised between chunks when the scan is cancelled mid-file"""
+
+
+# Read buffer bounds for full-file hashing
+MIN_BUFFER = 64 * 1024
+MAX_BUFFER = 16 * 1024 * 1024
+
+# Read buffers are reused per hashing thread instead of per chunk
+_buffers = threading.local()
+
+# Throttle of the scan a hashing thread or worker process belongs to
+_worker = threading.local()
+
+# How reads treat the page cache: "normal" leaves it to the kernel,
+# "dontneed" drops each file's pages once it is hashed, "direct" bypasses
+# the cache with O_DIRECT where the filesystem allows it
+CACHE_POLICIES = ("normal", "dontneed", "direct")
+
+# O_DIRECT needs buffer, offset and length aligned to the logical block size
+DIRECT_ALIGN = 4096
+
+# Fed to the hasher in place of holes in sparse files
+_ZEROS = memoryview(bytes(1024 * 1024))
+
+# Order in which staged checks run, cheapest first; lockstep comparison
+# stands in for the full hash on small groups
+STAGE_NAMES = ("head", "tail", "middle", "full", "lockstep", "verify")
+
+
+def plan_stages(size, head_bytes, tail_bytes, middle_samples, middle_bytes):
+    """Return the (name, ranges) checks for files of this size, ranges None meaning the whole file"""
+    stages = []
+    head = min(size, head_bytes)
+    if head:
+        stages.append(("head", [(0, head)]))
+    if head >= size:
+        return stages
+
+    # Sampled stages stop as soon as together they have covered every byte
+    tail_start = max(head, size - tail_bytes)
+    if tail_start < size:
+        stages.append(("tail", [(tail_start, size - tail_start)]))
+    if tail_start <= head:
+        return stages
+
+    gap = tail_start - head
+    if middle_samples and middle_bytes and middle_samples * middle_bytes < gap:
+        ranges = [
+            (head + (gap - middle_bytes) * i // (middle_samples + 1), middle_bytes)
+            for i in range(1, middle_samples + 1)
+        ]
+        stages.append(("middle", ranges))
+    stages.append(("full", None))
+    return stages
+
+
+def available_digests():
+    """Names of the digest algorithms usable on this machine"""
+    return list(DIGESTS)
+
+
+def new_hasher(algorithm):
+    """Create a fresh hasher for a registered digest algorithm"""
+    try:
+        return DIGESTS[algorithm]()
+    except KeyError:
+        raise ValueError(f"Unknown or unavailable digest algorithm: {algorithm}") from None
+
+
+def buffer_size_for(size, rotational=False):
+    """Pick a read buffer that keeps syscalls per file low without oversizing it"""
+    whole = max(MIN_BUFFER, 1 << max(size - 1, 0).bit_length())
+    if rotational or size < 1024 * 1024:
+        # Small files go in one read; on spinning disks a long read between
+        # seeks is worth a buffer as large as the file
+        return min(whole, MAX_BUFFER)
+    return min(max(whole // 64, 1024 * 1024), MAX_BUFFER)
+
+
+@lru_cache(maxsize=None)
+def is_rotational(dev):
+    """Whether a device number belongs to a spinning disk (Linux only)"""
+    try:
+        block = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+        # Partitions keep the queue settings on their parent disk
+        for queue_dir in (f"{block}/queue", f"{block}/../queue"):
+            path = f"{queue_dir}/rotational"
+            if os.path.exists(path):
+                with open(path) as f:
+                    return f.read().strip() == "1"
+    except (AttributeError, OSError, ValueError):
+        pass
+    return False
+
+
+def _aligned_buffer(size):
+    """Page-aligned buffer, usable for O_DIRECT reads"""
+    return memoryview(mmap.mmap(-1, size))
+
+
+def _read_buffer(size):
+    """Reusable per-thread read buffer of at least size bytes"""
+    view = getattr(_buffers, "view", None)
+    if view is None or len(view) < size:
+        view = _aligned_buffer(size)
+        _buffers.view = view
+    return view[:size]
+
+
+def _init_worker(throttle=None, nice=0, io_priority="normal", token=None, counter=None):
+    """Pool initializer: attach the scan's throttle, run token and byte counter, lower this worker's priority"""
+    _worker.throttle = throttle
+    _worker.token = token
+    _worker.counter = counter
+    _worker.priority = (nice, io_priority)
+    lower_priority(nice, io_priority)
+
+
+def _throttled(count, cancel_check=None):
+    """Charge bytes just read to the worker's counter and throttle, waiting if over the limit"""
+    # Every read passes through here, so holes filled with zeros and
+    # comparisons that stopped early are never counted as read
+    counter = getattr(_worker, "counter", None)
+    if counter is not None:
+        with counter.get_lock():
+            counter.value += count
+    throttle = getattr(_worker, "throttle", None)
+    if throttle is not None:
+        throttle.read(count, cancel_check)
+
+
+def _advise(fd, advice):
+    """Give the kernel a page cache hint by POSIX_FADV_* name, where the platform supports it"""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+        except OSError:
+            pass
+
+
+@contextmanager
+def open_for_hashing(filepath, cache_policy="normal", sequential=True, cancel_check=None):
+    """Open a file unbuffered for hashing under a page cache policy"""
+    throttle = getattr(_worker, "throttle", None)
+    if throttle is not None:
+        # Stop and Pause must not wait for the files-per-second bucket
+        throttle.open_file(cancel_check or getattr(_worker, "token", None))
+    f = None
+    if cache_policy == "direct" and hasattr(os, "O_DIRECT"):
+        try:
+            f = open(os.open(filepath, os.O_RDONLY | os.O_DIRECT), 'rb', buffering=0)
+        except OSError:
+            # tmpfs and some network filesystems refuse O_DIRECT, read
+            # through the cache and drop the pages afterwards instead
+            pass
+    if f is None:
+        f = open(filepath, 'rb', buffering=0)
+    with f:
+        if cache_policy != "normal" and sequential:
+            _advise(f.fileno(), "POSIX_FADV_SEQUENTIAL")
+        try:
+            yield f
+        finally:
+            if cache_policy != "normal":
+                # A scan touches every file once, its pages would only push
+                # other programs' working sets out of memory
+                _advise(f.fileno(), "POSIX_FADV_DONTNEED")
+
+
+def _update_range(f, hasher, view, offset, length, align=1, cancel_check=None):
+    """Feed length bytes of an open file starting at offset to the hasher"""
+    # Reads start on an aligned boundary and only the wanted bytes are
+    # hashed, which O_DIRECT needs and costs buffered reads nothing
+    chunk_size = len(view)
+    end = offset + length
+    position = offset - offset % align
+    f.seek(position)
+    while position < end:
+        if cancel_check is not None and cancel_check():
+            raise HashCancelled(f.name)
+        count = f.readinto(view[:min(chunk_size, -(-(end - position) // align) * align)])
+        if not count:
+            break
+        start = max(offset, position) - position
+        stop = min(end, position + count) - position
+        hasher.update(view[start:stop])
+        _throttled(count, cancel_check)
+        position += count
+
+
+def _update_zeros(hasher, count):
+    """Feed count zero bytes to the hasher without reading anything"""
+    while count > 0:
+        step = min(count, len(_ZEROS))
+        hasher.update(_ZEROS[:step])
+        count -= step
+
+
+def hash_ranges(filepath, ranges, algorithm="sha256", chunk_size=MIN_BUFFER, cache_policy="normal",
+                cancel_check=None):
+    """Calculate a digest over (offset, length) ranges of a file"""
+    align = DIRECT_ALIGN if cache_policy == "direct" else 1
+    hasher = new_hasher(algorithm)
+    view = _read_buffer(-(-chunk_size // align) * align)
+    with open_for_hashing(filepath, cache_policy, sequential=False, cancel_check=cancel_check) as f:
+        for offset, length in ranges:
+            _update_range(f, hasher, view, offset, length, align, cancel_check)
+    return hasher.digest()
+
+
+def is_sparse(st):
+    """Whether a stat result describes a file with fewer blocks than bytes"""
+    # st_blocks is in 512-byte units on every platform that has it; compressed
+    # filesystems also report fewer blocks, which only costs a few lseek calls
+    blocks = getattr(st, "st_blocks", None)
+    return blocks is not None and blocks * 512 < st.st_size
+
+
+def sparse_file(f):
+    """Whether holes in an open file can be found and skipped"""
+    return hasattr(os, "SEEK_DATA") and is_sparse(os.fstat(f.fileno()))
+
+
+def data_extents(fd, end, offset=0):
+    """Yield (offset, length) of the regions between offset and end that hold data"""
+    while offset < end:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # Only a hole remains up to the end of the file
+                return
+            raise
+        stop = min(end, os.lseek(fd, start, os.SEEK_HOLE))
+        if start >= stop:
+            return
+        yield start, stop - start
+        offset = stop
+
+
+def _update_sparse(f, hasher, view, offset, length, align=1, cancel_check=None):
+    """Feed a range of an open file to the hasher, reading only its data extents"""
+    # Holes read back as zeros, so hashing zeros for them gives exactly the
+    # digest of a dense read while the disk only serves the data
+    position = offset
+    for start, count in data_extents(f.fileno(), offset + length, offset):
+        _update_zeros(hasher, start - position)
+        _update_range(f, hasher, view, start, count, align, cancel_check)
+        position = start + count
+    if cancel_check is not None and cancel_check():
+        raise HashCancelled(f.name)
+    _update_zeros(hasher, offset + length - position)
+
+
+def hash_sparse(filepath, algorithm="sha256", chunk_size=MIN_BUFFER, cancel_check=None, cache_policy="normal"):
+    """Calculate a digest of a sparse file, reading only its data extents"""
+    align = DIRECT_ALIGN if cache_policy == "direct" else 1
+    hasher = new_hasher(algorithm)
+    view = _read_buffer(-(-chunk_size // DIRECT_ALIGN) * DIRECT_ALIGN)
+    with open_for_hashing(filepath, cache_policy, cancel_check=cancel_check) as f:
+        _update_sparse(f, hasher, view, 0, os.fstat(f.fileno()).st_size, align, cancel_check)
+    return hasher.digest()
+
+
+@contextmanager
+def mapped_view(f):
+    """Map an open file read-only and yield a memoryview of it"""
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mapped)
+        try:
+            yield view
+        finally:
+            # The map cannot close while a view still points into it
+            view.release()
+
+
+def _update_mapped(f, hasher, step=MAX_BUFFER, cancel_check=None):
+    """Feed the mapped pages of an open file straight to the hasher"""
+    with mapped_view(f) as view:
+        for offset in range(0, len(view), step):
+            if cancel_check is not None and cancel_check():
+                raise HashCancelled(f.name)
+            hasher.update(view[offset:offset + step])
+            _throttled(min(step, len(view) - offset), cancel_check)
+
+
+def hash_mapped(filepath, algorithm="sha256", step=MAX_BUFFER, cancel_check=None, cache_policy="normal"):
+    """Calculate a digest of file by feeding its mapped pages straight to the hasher"""
+    hasher = new_hasher(algorithm)
+    with open_for_hashing(filepath, cache_policy, cancel_check=cancel_check) as f:
+        _update_mapped(f, hasher, step, cancel_check)
+    return hasher.digest()
+
+
+def hash_file(filepath, algorithm="sha256", chunk_size=MIN_BUFFER, cancel_check=None, use_mmap=False,
+              cache_policy="normal"):
+    """Calculate a digest of file, checking for cancellation between chunks"""
+    align = DIRECT_ALIGN if cache_policy == "direct" else 1
+    view = _read_buffer(-(-chunk_size // DIRECT_ALIGN) * DIRECT_ALIGN)
+    with open_for_hashing(filepath, cache_policy, cancel_check=cancel_check) as f:
+        # One open file serves every strategy, and fstat on it costs no
+        # second path lookup
+        st = os.fstat(f.fileno())
+        if hasattr(os, "SEEK_DATA") and is_sparse(st):
+            try:
+                hasher = new_hasher(algorithm)
+                _update_sparse(f, hasher, view, 0, st.st_size, align, cancel_check)
+                return hasher.digest()
+            except OSError:
+                # Filesystem without hole support, a dense read gives the same digest
+                pass
+
+        # Mapped pages always go through the page cache
+        if use_mmap and cache_policy != "direct":
+            try:
+                hasher = new_hasher(algorithm)
+                _update_mapped(f, hasher, cancel_check=cancel_check)
+                return hasher.digest()
+            except (OSError, ValueError, OverflowError):
+                # Not mappable here (network share, address space), read it instead
+                pass
+
+        # Unbuffered readinto fills one reused buffer, with no bytes object per
+        # chunk; hashlib.file_digest would do the same but cannot be cancelled
+        hasher = new_hasher(algorithm)
+        f.seek(0)
+        while True:
+            if cancel_check is not None and cancel_check():
+                raise HashCancelled(filepath)
+            count = f.readinto(view)
+            if not count:
+                break
+            hasher.update(view[:count])
+            _throttled(count, cancel_check)
+    return hasher.digest()
+
+
+def _hash_segment(filepath, offset, length, algorithm, chunk_size, cancel_check, cache_policy):
+    """Digest one segment of a file on its own file handle"""
+    align = DIRECT_ALIGN if cache_policy == "direct" else 1
+    hasher = new_hasher(algorithm)
+    view = _read_buffer(-(-chunk_size // DIRECT_ALIGN) * DIRECT_ALIGN)
+    with open_for_hashing(filepath, cache_policy, cancel_check=cancel_check) as f:
+        if sparse_file(f):
+            try:
+                _update_sparse(f, hasher, view, offset, length, align, cancel_check)
+                return hasher.digest()
+            except OSError:
+                hasher = new_hasher(algorithm)
+        _update_range(f, hasher, view, offset, length, align, cancel_check)
+    return hasher.digest()
+
+
+def segment_pool(threads=0, throttle=None, nice=0, io_priority="normal", token=None, counter=None):
+    """Thread pool that hashes tree segments, shared by every file of a scan"""
+    return ThreadPoolExecutor(
+        max_workers=int(threads) or os.cpu_count() or 4,
+        thread_name_prefix="hardlinker-tree",
+        initializer=_init_worker,
+        initargs=(throttle, nice, io_priority, token, counter)
+    )
+
+
+_process_segments = None
+
+
+def _worker_segment_pool(threads):
+    """The segment pool of this worker process, created on its first tree digest"""
+    global _process_segments
+    if _process_segments is None:
+        nice, io_priority = getattr(_worker, "priority", (0, "normal"))
+        _process_segments = segment_pool(
+            threads, getattr(_worker, "throttle", None), nice, io_priority,
+            getattr(_worker, "token", None), getattr(_worker, "counter", None)
+        )
+    return _process_segments
+
+
+def hash_tree(filepath, size, algorithm="sha256", segment_size=64 * 1024 * 1024, threads=0,
+              chunk_size=MIN_BUFFER, cancel_check=None, cache_policy="normal", pool=None):
+    """Calculate a tree digest of file: segments hashed in parallel, then their digests together
+
+    Segments go to pool if given, else to a pool of threads made for this file.
+    """
+    # Not the flat digest of the file, so it must only ever be compared with
+    # tree digests of the same segment size
+    offsets = range(0, size, segment_size)
+    with ExitStack() as stack:
+        if pool is None:
+            nice, io_priority = getattr(_worker, "priority", (0, "normal"))
+            pool = stack.enter_context(segment_pool(
+                min(len(offsets), int(threads) or os.cpu_count() or 4) or 1,
+                getattr(_worker, "throttle", None), nice, io_priority,
+                getattr(_worker, "token", None), getattr(_worker, "counter", None)
+            ))
+        leaves = list(pool.map(
+            lambda offset: _hash_segment(
+                filepath, offset, min(segment_size, size - offset),
+                algorithm, chunk_size, cancel_check, cache_policy
+            ),
+            offsets
+        ))
+    root = new_hasher(algorithm)
+    root.update(b"hardlinker-tree")
+    root.update(segment_size.to_bytes(8, "little") + size.to_bytes(8, "little"))
+    for leaf in leaves:
+        root.update(leaf)
+    return root.digest()
+
+
+def hash_jobs(jobs, algorithm="sha256", cancel_check=None, mmap_threshold=0, cache_policy="normal",
+              tree_threads=0, tree_pool=None):
+    """Digest a batch of (path, size, ranges, chunk_size, segment_size) jobs, None for unreadable files"""
+    # Module level so worker processes can unpickle it; a segment size
+    # asks for a tree digest of the whole file, hashed on tree_pool or,
+    # in a worker process, on that process's own segment pool
+    if cancel_check is None:
+        # Worker processes check the run token they were started with
+        cancel_check = getattr(_worker, "token", None)
+    digests = []
+    for path, size, ranges, chunk_size, segment_size in jobs:
+        try:
+            if segment_size:
+                if tree_pool is None:
+                    tree_pool = _worker_segment_pool(tree_threads)
+                digest = hash_tree(
+                    path, size, algorithm, segment_size, tree_threads,
+                    chunk_size, cancel_check, cache_policy, tree_pool
+                )
+            elif ranges is None:
+                use_mmap = bool(mmap_threshold) and size >= mmap_threshold
+                digest = hash_file(path, algorithm, chunk_size, cancel_check, use_mmap, cache_policy)
+            else:
+                digest = hash_ranges(path, ranges, algorithm, cache_policy=cache_policy, cancel_check=cancel_check)
+        except Exception:
+            digest = None
+        digests.append(digest)
+    return digests
+
+
+class _BlockReader:
+    """Sequential blocks of one file, from its memory map or a read buffer"""
+
+    def __init__(self, stack, path, block_size, use_mmap, cache_policy="normal", cancel_check=None):
+        self.block_size = block_size
+        self.cancel_check = cancel_check
+        self.offset = 0
+        self.mapped = None
+        self.file = stack.enter_context(open_for_hashing(path, cache_policy, cancel_check=cancel_check))
+        self.block = None
+        self.size = os.fstat(self.file.fileno()).st_size
+        # Data regions still ahead of the reader, for files with holes
+        self.extents = None
+        self.zeros = None
+        if sparse_file(self.file):
+            try:
+                self.extents = deque(data_extents(self.file.fileno(), self.size))
+            except OSError:
+                pass
+        if use_mmap and cache_policy != "direct":
+            try:
+                self.mapped = stack.enter_context(mapped_view(self.file))
+                # Runs before the map closes, which refuses while views remain
+                stack.callback(self._release)
+            except (OSError, ValueError, OverflowError):
+                pass
+        if self.mapped is None:
+            self.buffer = _aligned_buffer(block_size)
+
+    def _release(self):
+        """Drop the view of the previous block"""
+        if self.block is not None:
+            self.block.release()
+            self.block = None
+
+    def _in_hole(self):
+        """Whether the next block lies entirely in a hole"""
+        end = self.offset + self.block_size
+        while self.extents and sum(self.extents[0]) <= self.offset:
+            self.extents.popleft()
+        return self.offset < self.size and not (self.extents and self.extents[0][0] < end)
+
+    def next_block(self):
+        """Return a view of the next block, empty at end of file"""
+        self._release()
+        if self.extents is not None:
+            if self._in_hole():
+                # Reads back as zeros, so neither the disk nor the throttle is involved
+                if self.zeros is None:
+                    self.zeros = memoryview(bytes(self.block_size))
+                self.block = self.zeros[:min(self.block_size, self.size - self.offset)]
+                self.offset += len(self.block)
+                return self.block
+            if self.mapped is None:
+                # Skipped holes left the file position behind
+                self.file.seek(self.offset)
+        if self.mapped is not None:
+            self.block = self.mapped[self.offset:self.offset + self.block_size]
+        else:
+            self.block = self.buffer[:self.file.readinto(self.buffer)]
+        self.offset += len(self.block)
+        _throttled(len(self.block), self.cancel_check)
+        return self.block
+
+
+def _split_block(members, blocks):
+    """Partition member indexes by identical block content"""
+    parts = []
+    for index in members:
+        for part in parts:
+            if blocks[index] == blocks[part[0]]:
+                part.append(index)
+                break
+        else:
+            parts.append([index])
+    return parts
+
+
+def lockstep_compare(paths, algorithm="sha256", block_size=MIN_BUFFER, use_mmap=False, cancel_check=None,
+                     cache_policy="normal"):
+    """Read same-sized files side by side, returning (indexes, digest) for each set identical to the end"""
+    # Files drop out at their first differing block; sets that survive to
+    # the end are equal byte for byte and get a digest for the cache as well
+    if cancel_check is None:
+        cancel_check = getattr(_worker, "token", None)
+    with ExitStack() as stack:
+        readers = {}
+        for index, path in enumerate(paths):
+            try:
+                readers[index] = _BlockReader(stack, path, block_size, use_mmap, cache_policy, cancel_check)
+            except OSError:
+                continue
+
+        matched = []
+        groups = [(list(readers), new_hasher(algorithm))]
+        while groups:
+            if cancel_check is not None and cancel_check():
+                raise HashCancelled(paths[0])
+            next_groups = []
+            for members, hasher in groups:
+                if len(members) < 2:
+                    continue
+                blocks = {index: readers[index].next_block() for index in members}
+                parts = [part for part in _split_block(members, blocks) if len(part) > 1]
+                for number, part in enumerate(parts):
+                    block = blocks[part[0]]
+                    # The last part may keep the hasher, the others branch off a copy
+                    part_hasher = hasher if number == len(parts) - 1 else hasher.copy()
+                    if not block:
+                        matched.append((part, part_hasher.digest()))
+                        continue
+                    part_hasher.update(block)
+                    next_groups.append((part, part_hasher))
+            groups = next_groups
+        return matched
+
+
+class ThreadHashEngine:
+    """Run hashing jobs on a thread pool so several files are read at once"""
+
+    batch_size = 1
+
+    def __init__(self, threads=0, algorithm="sha256", cancel_check=None, mmap_threshold=0,
+                 cache_policy="normal", throttle=None, nice=0, io_priority="normal", tree_threads=0):
+        # hashlib releases the GIL on large updates, so threads scale with cores
+        self.workers = int(threads) or os.cpu_count() or 4
+        self.algorithm = algorithm
+        self.cancel_check = cancel_check
+        self.mmap_threshold = mmap_threshold
+        self.cache_policy = cache_policy
+        self.tree_threads = tree_threads
+        self._counter = MP_CONTEXT.Value("q", 0)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="hardlinker-hash",
+            initializer=_init_worker,
+            initargs=(throttle, nice, io_priority, None, self._counter)
+        )
+        # One bounded set of segment readers for all files, however many
+        # hashers are waiting on tree digests at once
+        self._segments = segment_pool(tree_threads, throttle, nice, io_priority, None, self._counter)
+
+    @property
+    def bytes_read(self):
+        """Bytes the workers have actually read so far"""
+        return self._counter.value
+
+    def run_batch(self, jobs, done):
+        """Digest jobs on the pool and pass the digests to done"""
+        self._executor.submit(lambda: done(
+            hash_jobs(
+                jobs, self.algorithm, self.cancel_check, self.mmap_threshold,
+                self.cache_policy, self.tree_threads, self._segments
+            )
+        ))
+
+    def run_compare(self, paths, size, block_size, done):
+        """Compare files in lockstep on the pool and pass the matched sets to done"""
+        def compare():
+            try:
+                use_mmap = bool(self.mmap_threshold) and size >= self.mmap_threshold
+                matched = lockstep_compare(
+                    paths, self.algorithm, block_size, use_mmap, self.cancel_check, self.cache_policy
+                )
+            except Exception:
+                matched = []
+            done(matched)
+
+        self._executor.submit(compare)
+
+    def shutdown(self):
+        """Drop queued jobs and let running ones finish in the background"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._segments.shutdown(wait=False, cancel_futures=True)
+
+
+class ProcessHashEngine:
+    """Run hashing jobs in worker processes, several files per round trip"""
+
+    def __init__(self, processes=0, algorithm="sha256", batch_size=32, mmap_threshold=0,
+                 cache_policy="normal", throttle=None, nice=0, io_priority="normal", tree_threads=0,
+                 cancel_token=None):
+        # Batching amortises pickling and IPC over many small files
+        self.workers = int(processes) or os.cpu_count() or 4
+        self.algorithm = algorithm
+        self.batch_size = max(1, int(batch_size))
+        self.mmap_threshold = mmap_threshold
+        self.cache_policy = cache_policy
+        # The engine's segment threads are split between its processes, each
+        # of which keeps its share in one pool for all its files
+        self.tree_threads = max(1, (int(tree_threads) or os.cpu_count() or 4) // self.workers)
+        # The throttle's and counter's shared memory can only reach workers as they start
+        self._counter = MP_CONTEXT.Value("q", 0)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=MP_CONTEXT,
+            initializer=_init_worker,
+            initargs=(throttle, nice, io_priority, cancel_token, self._counter)
+        )
+
+    @property
+    def bytes_read(self):
+        """Bytes the worker processes have actually read so far"""
+        return self._counter.value
+
+    def run_batch(self, jobs, done):
+        """Digest jobs in a worker process and pass the digests to done"""
+        def finished(future):
+            if future.cancelled() or future.exception() is not None:
+                done([None] * len(jobs))
+            else:
+                done(future.result())
+
+        # Worker processes only see a RunToken passed at startup; without
+        # one, queued batches are still dropped on shutdown
+        future = self._executor.submit(
+            hash_jobs, jobs, self.algorithm, None, self.mmap_threshold,
+            self.cache_policy, self.tree_threads
+        )
+        future.add_done_callback(finished)
+
+    def run_compare(self, paths, size, block_size, done):
+        """Compare files in lockstep in a worker process and pass the matched sets to done"""
+        def finished(future):
+            if future.cancelled() or future.exception() is not None:
+                done([])
+            else:
+                done(future.result())
+
+        use_mmap = bool(self.mmap_threshold) and size >= self.mmap_threshold
+        future = self._executor.submit(
+            lockstep_compare, paths, self.algorithm, block_size, use_mmap, None, self.cache_policy
+        )
+        future.add_done_callback(finished)
+
+    def shutdown(self):
+        """Drop queued batches and let running ones finish in the background"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_engine(backend, workers=0, algorithm="sha256", cancel_check=None,
+                  batch_size=32, mmap_threshold=0, cache_policy="normal",
+                  throttle=None, nice=0, io_priority="normal", tree_threads=0):
+    """Create the hashing engine for a backend name"""
+    # Fail on the scan thread rather than once per file in the workers
+    new_hasher(algorithm)
+    if cache_policy not in CACHE_POLICIES:
+        raise ValueError(f"Unknown read cache policy: {cache_policy}")
+    if backend == "process":
+        # Only a RunToken's shared events can cross into worker processes
+        cancel_token = cancel_check if isinstance(cancel_check, RunToken) else None
+        return ProcessHashEngine(
+            workers, algorithm, batch_size, mmap_threshold, cache_policy,
+            throttle, nice, io_priority, tree_threads, cancel_token
+        )
+    if backend != "thread":
+        raise ValueError(f"Unknown hash backend: {backend}")
+    return ThreadHashEngine(
+        workers, algorithm, cancel_check, mmap_threshold, cache_policy,
+        throttle, nice, io_priority, tree_threads
+    )
@@ -0,0 +1,184 @@
+"""
+HardLinker Link Journal
+Write-ahead log of a link run, so a crash can be repaired and the run resumed
+"""
+
+import json
+import os
+
+from linker import LinkEntry
+
+# Records per fsync of completed batches; a crash repeats at most this many
+# directories, which is harmless since relinking a linked file is skipped
+FLUSH_EVERY = 256
+
+
+def _fsync_directory(path):
+    """Make a rename inside path durable, where directories can be opened"""
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    except OSError:
+        # Windows cannot open directories; NTFS journals the rename itself
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class LinkJournal:
+    """Append-only journal of planned and completed directory batches"""
+
+    def __init__(self, path, flush_every=FLUSH_EVERY):
+        self.path = path
+        self.flush_every = max(1, int(flush_every))
+        self._file = None
+        self._buffered = 0
+
+    def begin(self, batches):
+        """Durably record the whole plan before anything is linked"""
+        # Written aside and renamed into place, so a crash while planning
+        # leaves either no journal or the previous one, never half a plan
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for index, (directory, entries) in enumerate(batches):
+                record = {"op": "plan", "batch": index, "dir": directory, "entries": entries}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        _fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def completed(self, index):
+        """Record a batch whose every entry was attempted"""
+        self._file.write(json.dumps({"op": "done", "batch": index}) + "\n")
+        self._buffered += 1
+        if self._buffered >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write buffered completions through to the disk"""
+        if self._file is None or not self._buffered:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffered = 0
+
+    def close(self, finished=True):
+        """Close the journal, deleting it once nothing is left to resume"""
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        if finished:
+            discard_journal(self.path)
+
+
+def discard_journal(path):
+    """Delete a journal that is done with or declined"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def pending_batches(path):
+    """Batches planned in the journal but never recorded as done, or None without a journal"""
+    try:
+        f = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    planned = {}
+    done = set()
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may be torn by the crash; it was never flushed
+                break
+            if record.get("op") == "plan":
+                try:
+                    entries = [LinkEntry(*entry) for entry in record["entries"]]
+                except TypeError:
+                    # Planned by a version with other entry fields; linking
+                    # from it could not be checked safely
+                    return []
+                planned[record["batch"]] = (record["dir"], entries)
+            elif record.get("op") == "done":
+                done.add(record["batch"])
+    return [batch for index, batch in sorted(planned.items()) if index not in done]
+
+
+def _leftover_links(directory):
+    """{duplicate name: [temp names]} for temporary links left behind in a directory"""
+    leftovers = {}
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return leftovers
+    for name in names:
+        # .{name}.hardlinker-{pid}-{tid}.tmp, see linker.temp_link_name
+        if name.startswith(".") and name.endswith(".tmp") and ".hardlinker-" in name:
+            original = name[1:name.rindex(".hardlinker-")]
+            leftovers.setdefault(original, []).append(name)
+    return leftovers
+
+
+def _lstat(path):
+    """lstat that returns None for a missing or unreadable path"""
+    try:
+        return os.lstat(path)
+    except OSError:
+        return None
+
+
+def recover_batches(batches):
+    """Repair interrupted links and drop finished or no longer safe entries
+
+    Returns (batches still to link, links rolled forward, links rolled back).
+    """
+    remaining = []
+    forward = back = 0
+    masters = {}
+    for directory, entries in batches:
+        leftovers = _leftover_links(directory)
+        todo = []
+        for entry in entries:
+            duplicate_path = os.path.join(directory, entry.name)
+            duplicate = _lstat(duplicate_path)
+            # Only a duplicate still exactly as scanned may be replaced
+            unchanged = duplicate is not None and (
+                (duplicate.st_ino, duplicate.st_mtime_ns) == (entry.ino, entry.mtime_ns)
+            )
+            # And only with a master that still holds the content it was scanned with
+            master_ok = masters.get(entry.master)
+            if master_ok is None:
+                master = _lstat(entry.master)
+                master_ok = masters[entry.master] = master is not None and (
+                    (master.st_ino, master.st_mtime_ns) == (entry.master_ino, entry.master_mtime_ns)
+                )
+            unchanged = unchanged and master_ok
+            for temp_name in leftovers.pop(entry.name, ()):
+                temp_path = os.path.join(directory, temp_name)
+                temp = _lstat(temp_path)
+                try:
+                    if temp is not None and temp.st_ino == entry.master_ino and unchanged:
+                        # The link was made but not yet renamed over the duplicate
+                        os.replace(temp_path, duplicate_path)
+                        forward += 1
+                        unchanged = False
+                    else:
+                        os.unlink(temp_path)
+                        back += 1
+                except OSError:
+                    pass
+            if unchanged:
+                todo.append(entry)
+        if todo:
+            remaining.append((directory, todo))
+    return remaining, forward, back
@@ -0,0 +1,230 @@
+"""
+HardLinker Link Executor
+Replaces duplicate files with hardlinks, several groups at once
+"""
+
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+# linkat/renameat/unlinkat against open directories; os.replace shares
+# os.rename's implementation. Windows has none of them and uses full paths
+DIR_FD_LINKS = {os.link, os.rename, os.unlink} <= os.supports_dir_fd
+
+# When renamed links are forced to disk: never, one directory fsync per
+# sync_every links and at the end of each directory, or after every link
+DURABILITY_LEVELS = ("none", "batched", "strict")
+
+# Master folder descriptors each task keeps open, least recently used closed
+# first; bounded so copies of masters from all over the tree cannot use up
+# the process's file descriptors
+MASTER_DIR_FDS = 8
+
+
+class LinkResult(NamedTuple):
+    """Counters for one group, or summed over a whole run"""
+    success: int = 0
+    failed: int = 0
+    saved: int = 0
+    syncs: int = 0
+
+
+class LinkEntry(NamedTuple):
+    """One duplicate to replace, with what the scan saw so a resumed run can tell if it changed"""
+    master: str
+    name: str
+    size: int
+    master_ino: int
+    master_mtime_ns: int
+    ino: int
+    mtime_ns: int
+
+
+def temp_link_name(duplicate_file):
+    """Hidden name next to the duplicate, unique to this process and thread"""
+    directory, name = os.path.split(duplicate_file)
+    return os.path.join(directory, f".{name}.hardlinker-{os.getpid()}-{threading.get_native_id()}.tmp")
+
+
+def link_duplicate(master_file, duplicate_file, master_dir_fd=None, dir_fd=None):
+    """Atomically replace duplicate_file with a hardlink to master_file
+
+    With directory descriptors both names are relative to them.
+    """
+    # The new link appears under a temporary name and is renamed over the
+    # duplicate in one step, so the path never goes missing and a failure
+    # at any point leaves the duplicate as it was
+    temp_file = temp_link_name(duplicate_file)
+    os.link(master_file, temp_file, src_dir_fd=master_dir_fd, dst_dir_fd=dir_fd)
+    try:
+        os.replace(temp_file, duplicate_file, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+    except BaseException:
+        try:
+            os.unlink(temp_file, dir_fd=dir_fd)
+        except OSError:
+            pass
+        raise
+
+
+def open_directory(path):
+    """Open a directory descriptor for *at() calls"""
+    return os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+
+
+def sync_directory(dir_fd):
+    """Flush a directory's entries, and the link counts they changed, to disk"""
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        # Some network filesystems refuse fsync on directories
+        pass
+
+
+def plan_directories(groups):
+    """Batch duplicates by parent directory as {directory: [LinkEntry]}"""
+    batches = defaultdict(list)
+    for group in groups:
+        master = group[0]
+        for record in group[1:]:
+            directory, name = os.path.split(record.path)
+            # Every file of a group has the size recorded by the scan
+            batches[directory].append(
+                LinkEntry(
+                    master.path, name, master.size, master.ino, master.mtime_ns,
+                    record.ino, record.mtime_ns
+                )
+            )
+    return batches
+
+
+class LinkExecutor:
+    """Link duplicates on a thread pool, one parent directory per task"""
+
+    def __init__(self, workers=8, cancel_check=None, throttle=None, progress=None,
+                 durability="batched", sync_every=256):
+        # Linking is round trips, not CPU, so threads help most on network shares
+        self.workers = max(1, int(workers))
+        self.cancel_check = cancel_check
+        self.throttle = throttle
+        self.progress = progress
+        self.durability = durability if durability in DURABILITY_LEVELS else "batched"
+        self.sync_every = 1 if self.durability == "strict" else max(1, int(sync_every))
+
+    def _cancelled(self):
+        """Whether the run was cancelled, waiting first while it is paused"""
+        return self.cancel_check is not None and self.cancel_check()
+
+    @staticmethod
+    def _master_fd(master_fds, master_dir, directory, dir_fd):
+        """Descriptor of a master's folder from the task's small LRU of open folders"""
+        if master_dir == directory:
+            return dir_fd
+        master_fd = master_fds.get(master_dir)
+        if master_fd is not None:
+            master_fds.move_to_end(master_dir)
+            return master_fd
+        if len(master_fds) >= MASTER_DIR_FDS:
+            os.close(master_fds.popitem(last=False)[1])
+        master_fd = master_fds[master_dir] = open_directory(master_dir)
+        return master_fd
+
+    def _link_directory(self, directory, entries):
+        """Link every duplicate in one directory, resolving its path only once
+
+        Returns (LinkResult, whether every entry was attempted).
+        """
+        # A whole directory belongs to one task, so no two workers ever
+        # create and rename links in the same place at the same time
+        success = failed = saved = syncs = 0
+        unsynced = 0
+        dir_fd = None
+        master_fds = OrderedDict()
+        try:
+            if DIR_FD_LINKS:
+                dir_fd = open_directory(directory)
+        except OSError:
+            return LinkResult(0, len(entries), 0), True
+        # Entries sharing a master folder run back to back, so each master
+        # folder is opened about once even with only a few kept open
+        entries = sorted(entries, key=lambda entry: os.path.dirname(entry.master))
+        try:
+            attempted = 0
+            for master_file, name, size, *_ in entries:
+                if self._cancelled():
+                    break
+                if self.throttle is not None:
+                    self.throttle.open_file(self.cancel_check)
+                    if self._cancelled():
+                        break
+                attempted += 1
+                try:
+                    if dir_fd is None:
+                        link_duplicate(master_file, os.path.join(directory, name))
+                    else:
+                        master_dir, master_name = os.path.split(master_file)
+                        master_fd = self._master_fd(master_fds, master_dir, directory, dir_fd)
+                        link_duplicate(master_name, name, master_fd, dir_fd)
+                    saved += size
+                    success += 1
+                    unsynced += 1
+                except Exception:
+                    failed += 1
+                    continue
+                # Every link renamed into this one directory since the last
+                # sync goes to disk with a single fsync
+                if unsynced >= self.sync_every and self.durability != "none" and dir_fd is not None:
+                    sync_directory(dir_fd)
+                    syncs += 1
+                    unsynced = 0
+        finally:
+            # Also after a cancel or error, so whatever was linked is durable
+            # before the journal records the directory as done
+            if unsynced and self.durability != "none" and dir_fd is not None:
+                sync_directory(dir_fd)
+                syncs += 1
+            for fd in master_fds.values():
+                os.close(fd)
+            if dir_fd is not None:
+                os.close(dir_fd)
+        return LinkResult(success, failed, saved, syncs), attempted == len(entries)
+
+    def run(self, groups):
+        """Link all groups, returning (LinkResult totals, cancelled)"""
+        return self.run_batches(list(plan_directories(groups).items()))
+
+    def run_batches(self, batches, journal=None):
+        """Link [(directory, entries)] batches, marking each finished one in a begun journal"""
+        total_files = sum(len(entries) for _, entries in batches)
+        # Counters are summed here as directories finish, never shared by workers
+        success = failed = saved = syncs = 0
+        done_files = 0
+        pending = {}
+        batches = iter(enumerate(batches))
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hardlinker-link") as executor:
+            while True:
+                # A few directories queued per worker, not the whole list at once
+                while len(pending) < self.workers * 4 and not self._cancelled():
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+                    index, (directory, entries) = batch
+                    future = executor.submit(self._link_directory, directory, entries)
+                    pending[future] = (index, len(entries))
+                if not pending:
+                    break
+                finished, waiting = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result, complete = future.result()
+                    success += result.success
+                    failed += result.failed
+                    saved += result.saved
+                    syncs += result.syncs
+                    index, count = pending.pop(future)
+                    done_files += count
+                    if complete and journal is not None:
+                        journal.completed(index)
+                if self.progress is not None:
+                    self.progress(done_files, total_files, LinkResult(success, failed, saved, syncs))
+        return LinkResult(success, failed, saved, syncs), self._cancelled()
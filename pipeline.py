@@ -0,0 +1,597 @@
+"""
+HardLinker Scan Pipeline
+Finds duplicate files while the tree is still being walked
+"""
+
+import itertools
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+
+from hashcache import stage_id
+from hashing import (
+    CRYPTOGRAPHIC_DIGESTS, STAGE_NAMES, buffer_size_for, create_engine, is_rotational, plan_stages
+)
+from placement import Elevator, physical_key
+from walker import ParallelWalker, with_identity
+
+
+# Files opened side by side when confirming a group against its first file
+VERIFY_FILES = 8
+
+
+class DuplicateFinder:
+    """Overlap walking, size bucketing and hashing through bounded queues"""
+
+    def __init__(self, walker_threads=8, hash_threads=0, hash_backend="thread",
+                 batch_size=32, algorithm="sha256", mmap_threshold=0, cache=None, queue_size=4096, max_in_flight=None, cancel_check=None, progress=None,
+                 head_bytes=16384, tail_bytes=16384, middle_samples=3, middle_bytes=16384,
+                 lockstep=True, lockstep_min_size=1024 * 1024,
+                 hdd_mode="auto", readers_per_disk=1, cache_policy="normal",
+                 throttle=None, nice=0, io_priority="normal",
+                 tree_threshold=0, tree_segment_size=64 * 1024 * 1024, tree_threads=0):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.middle_samples = middle_samples
+        self.middle_bytes = middle_bytes
+        self.lockstep = lockstep
+        self.lockstep_min_size = lockstep_min_size
+        self.hdd_mode = hdd_mode
+        self.readers_per_disk = max(1, int(readers_per_disk))
+        self.cache_policy = cache_policy
+        self.throttle = throttle
+        self.nice = nice
+        self.io_priority = io_priority
+        self.tree_threshold = tree_threshold
+        self.tree_segment_size = tree_segment_size
+        self.tree_threads = tree_threads
+        self.walker_threads = walker_threads
+        self.hash_threads = hash_threads
+        self.hash_backend = hash_backend
+        self.batch_size = batch_size
+        self.algorithm = algorithm
+        self.mmap_threshold = mmap_threshold
+        self.cache = cache
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight
+        self.cancel_check = cancel_check
+        self.progress = progress
+
+    def run(self, top):
+        """Return duplicate groups under top, or None if the scan was cancelled"""
+        self._events = queue.Queue()
+        self._engine = create_engine(
+            self.hash_backend,
+            workers=self.hash_threads,
+            algorithm=self.algorithm,
+            cancel_check=self.cancel_check,
+            batch_size=self.batch_size,
+            mmap_threshold=self.mmap_threshold,
+            cache_policy=self.cache_policy,
+            throttle=self.throttle,
+            nice=self.nice,
+            io_priority=self.io_priority,
+            tree_threads=self.tree_threads
+        )
+        # Keep every hasher busy with one more batch queued behind it
+        self._max_in_flight = (
+            self.max_in_flight or self._engine.workers * self._engine.batch_size * 2
+        )
+        self._walk_slots = threading.Semaphore(self.queue_size)
+        self._owed_slots = 0
+        self._stopped = threading.Event()
+        self._backlog = deque()
+        self._ready = deque()
+        self._elevators = defaultdict(Elevator)
+        self._positions = {}
+        self._readers = defaultdict(int)
+        self._waiting_compares = defaultdict(deque)
+        self._in_flight = 0
+        self._lone = {}
+        self._opened = set()
+        self._buckets = defaultdict(dict)
+        self._nodes = defaultdict(list)
+        self._stages = {}
+        self._dropped = {}
+        self._compared_out = 0
+        # Inode to the lockstep set that proved it equal to the others in it
+        self._proofs = {}
+        self._proof_ids = itertools.count()
+        self._verifying = {}
+        self._unverified = set()
+        self._splits = {}
+        self._verified_out = 0
+        self.files_seen = 0
+        self.aliases = 0
+        self.cross_device = 0
+        self.eliminated = {}
+        self.candidates = 0
+        self.checked = 0
+        self.cached = 0
+        self.bytes_read = 0
+        self.seconds = 0.0
+        start = time.perf_counter()
+
+        threading.Thread(target=self._feed, args=(top,), daemon=True).start()
+
+        try:
+            walk_done = False
+            while not walk_done or self._in_flight or self._backlog or self._queued():
+                if self.cancel_check is not None and self.cancel_check():
+                    return None
+
+                kind, payload = self._events.get()
+                if kind == "file":
+                    self.files_seen += 1
+                    self._add_file(payload)
+                    self._owed_slots += 1
+                elif kind == "walk_done":
+                    walk_done = True
+                elif kind == "hashed":
+                    self._add_digests(*payload)
+                elif kind == "compared":
+                    self._add_compared(*payload)
+
+                self._submit_backlog()
+                self._release_walk_slots()
+
+            # Digest matches that are not proof enough are read once more
+            self._verify_groups()
+            while self._in_flight:
+                if self.cancel_check is not None and self.cancel_check():
+                    return None
+                kind, payload = self._events.get()
+                if kind == "verified":
+                    self._add_verified(*payload)
+
+            # Workers that saw the cancel mid-file reported no digest, which
+            # must not pass for a finished scan
+            if self.cancel_check is not None and self.cancel_check():
+                return None
+            self.cross_device = self._count_cross_device()
+            self.eliminated = self._count_eliminated()
+            return self._collect_groups()
+        finally:
+            self.seconds = time.perf_counter() - start
+            self._stopped.set()
+            self._engine.shutdown()
+            # Counted by the readers themselves, so sparse holes, tree
+            # segments and comparisons cut short are all exact
+            self.bytes_read = self._engine.bytes_read
+
+    def _feed(self, top):
+        """Walker thread: push file records into the coordinator's queue"""
+        walker = ParallelWalker(
+            workers=self.walker_threads,
+            cancel_check=lambda: self._stopped.is_set() or (
+                self.cancel_check is not None and self.cancel_check()
+            )
+        )
+        walk = walker.walk(top)
+        try:
+            for record in walk:
+                if record.size == 0:
+                    continue
+                # Block while the coordinator is this many files behind
+                while not self._walk_slots.acquire(timeout=0.1):
+                    if self._stopped.is_set():
+                        return
+                self._events.put(("file", record))
+        finally:
+            walk.close()
+            self._events.put(("walk_done", None))
+
+    def _stages_for(self, size):
+        """Staged checks shared by every file of this size"""
+        stages = self._stages.get(size)
+        if stages is None:
+            stages = plan_stages(
+                size, self.head_bytes, self.tail_bytes,
+                self.middle_samples, self.middle_bytes
+            )
+            self._stages[size] = stages
+        return stages
+
+    def _add_file(self, record):
+        """Bucket a record by device, size and inode, releasing the bucket at two inodes"""
+        # Hardlinks cannot cross devices, so files only ever compete with
+        # same-sized files on their own device
+        key = (record.dev, record.size)
+        if key not in self._opened:
+            if key not in self._lone:
+                # A key seen once is not a candidate yet, skip identity lookup
+                self._lone[key] = record
+                return
+            self._opened.add(key)
+            self._add_inode(self._lone.pop(key))
+        self._add_inode(record)
+
+    def _add_inode(self, record):
+        """Add a record to its bucket, collapsing names of the same inode"""
+        try:
+            record = with_identity(record)
+        except OSError:
+            return
+        # On Windows dev was only known after with_identity, so the bucket
+        # key can be more specific than the key the file arrived under
+        inodes = self._buckets[(record.dev, record.size)]
+        names = inodes.get(record.inode)
+        if names is not None:
+            # Already hardlinked to a known name, its content is never read
+            names.append(record)
+            self.aliases += 1
+            return
+        inodes[record.inode] = [record]
+        self._place(record, (record.dev, record.size))
+
+    def _place(self, record, key):
+        """Add an inode to the node for the digests it has so far"""
+        # A node is keyed by (dev, size) plus one digest per finished stage;
+        # files only move on to the next stage once a node has two of them
+        node = self._nodes[key]
+        node.append(record)
+        stages = self._stages_for(record.size)
+        level = len(key) - 2
+        if level == len(stages):
+            return
+        if len(node) == 2:
+            # The first inode waited alone until a second one made it a candidate
+            if self._compares(stages[level][0], record.dev, record.size):
+                self._start_compare(list(node), key)
+                return
+            for waiting in node:
+                self._queue_hash(waiting, key)
+        elif len(node) > 2:
+            self._queue_hash(record, key)
+            # Files a comparison found unique may still match this newcomer
+            for dropped in self._dropped.pop(key, ()):
+                self._compared_out -= 1
+                self._queue_hash(dropped, key)
+
+    def _compares(self, stage_name, dev, size):
+        """Whether a node's first two files are compared in lockstep instead of hashed"""
+        # Lockstep digests are flat, so tree-hashed sizes are always hashed.
+        # Only pairs are ever interleaved, which even a spinning disk serves
+        # without seeking harder than two sequential hashes
+        return (
+            stage_name == "full" and self.lockstep
+            and size >= self.lockstep_min_size and not self._segment_size(dev, size)
+        )
+
+    def _segment_size(self, dev, size):
+        """Tree hash segment size for full checks of these files, 0 for a flat digest"""
+        # Parallel segment reads only seek on a disk read in physical order
+        if self.tree_threshold and size >= self.tree_threshold and not self._ordered(dev):
+            return self.tree_segment_size
+        return 0
+
+    def _stage_id(self, dev, size, level):
+        """Cache identity of a stage check, marking tree digests apart from flat ones"""
+        name, ranges = self._stages_for(size)[level]
+        segment_size = self._segment_size(dev, size) if ranges is None else 0
+        if segment_size:
+            return f"{name}:tree{segment_size}"
+        return stage_id(name, ranges)
+
+    def _start_compare(self, records, key):
+        """Compare a node's first two files in lockstep, or place them from the cache"""
+        dev, size = key[:2]
+        if self.cache is not None:
+            stage = self._stage_id(dev, size, len(key) - 2)
+            found = self.cache.lookup_bucket(
+                dev, size, self.algorithm, stage,
+                [(record.ino, record.mtime_ns, record.path) for record in records]
+            )
+            if found:
+                # Cached digests only match other digests, hash the rest
+                for record in records:
+                    digest = found.get(record.ino)
+                    if digest is None:
+                        self._queue_hash(record, key)
+                    else:
+                        self.cached += 1
+                        self.checked += 1
+                        self._place(record, key + (digest,))
+                return
+
+        # Lockstep stops at the first differing block and yields the same flat
+        # digest as hashing, so files that arrive later are simply hashed and
+        # land in the same node
+        self.candidates += len(records)
+        self._run_compare(records, key, "compared")
+
+    def _run_compare(self, records, key, kind):
+        """Compare files in lockstep, waiting for a free reader on disks read in order"""
+        self._in_flight += len(records)
+        dev = key[0]
+        if self._ordered(dev):
+            self._waiting_compares[dev].append((records, key, kind))
+            self._start_compares(dev)
+            return
+        self._send_compare(records, key, kind)
+
+    def _start_compares(self, dev):
+        """Send waiting comparisons of a disk while it has readers to spare"""
+        waiting = self._waiting_compares[dev]
+        while waiting and self._readers[dev] < self.readers_per_disk:
+            self._readers[dev] += 1
+            self._send_compare(*waiting.popleft())
+
+    def _send_compare(self, records, key, kind):
+        """Hand a comparison to the engine, its result coming back as a kind event"""
+        dev, size = key[:2]
+        self._engine.run_compare(
+            [record.path for record in records],
+            size,
+            buffer_size_for(size, is_rotational(dev)),
+            lambda matched: self._events.put((kind, (records, key, matched)))
+        )
+
+    def _compare_done(self, key):
+        """Free the reader of a finished comparison"""
+        dev = key[0]
+        if self._ordered(dev):
+            self._readers[dev] -= 1
+            self._start_compares(dev)
+
+    def _queue_hash(self, record, key):
+        """Queue a record for the next stage check of its node"""
+        self.candidates += 1
+        self._backlog.append((record, key))
+
+    def _submit_backlog(self):
+        """Move queued records to the hashers while staying under the in-flight cap"""
+        if self.cache is None:
+            while self._backlog:
+                self._make_ready(self._backlog.popleft())
+        else:
+            self._resolve_cached()
+
+        while self._in_flight < self._max_in_flight:
+            tasks = self._next_batch()
+            if not tasks:
+                break
+            jobs = [self._job(record, key) for record, key in tasks]
+            self._engine.run_batch(
+                jobs,
+                lambda digests, tasks=tasks: self._events.put(("hashed", (tasks, digests)))
+            )
+            self._in_flight += len(tasks)
+
+    def _job(self, record, key):
+        """Hashing job for the next stage check of a record"""
+        ranges = self._stages_for(record.size)[len(key) - 2][1]
+        return (
+            record.path,
+            record.size,
+            ranges,
+            buffer_size_for(record.size, is_rotational(record.dev)),
+            self._segment_size(record.dev, record.size) if ranges is None else 0
+        )
+
+    def _ordered(self, dev):
+        """Whether reads on this device go out in physical order"""
+        if self.hdd_mode == "auto":
+            return is_rotational(dev)
+        return self.hdd_mode == "on"
+
+    def _make_ready(self, task):
+        """Queue a task for the hashers, by platter position on spinning disks"""
+        record = task[0]
+        if self._ordered(record.dev):
+            # A file is queued once per stage, its position only looked up once
+            position = self._positions.get((record.dev, record.ino))
+            if position is None:
+                position = self._positions[(record.dev, record.ino)] = physical_key(record)
+            self._elevators[record.dev].push(position, task)
+        else:
+            self._ready.append(task)
+
+    def _queued(self):
+        """Number of tasks waiting for a hasher"""
+        return len(self._ready) + sum(len(elevator) for elevator in self._elevators.values())
+
+    def _next_batch(self):
+        """Take the next batch, one sweep of a disk that has a free reader first"""
+        # A disk with more readers than it has heads only seeks between them
+        for dev, elevator in self._elevators.items():
+            if elevator and self._readers[dev] < self.readers_per_disk:
+                count = min(self._engine.batch_size, len(elevator))
+                self._readers[dev] += 1
+                return [elevator.pop() for _ in range(count)]
+        count = min(self._engine.batch_size, len(self._ready))
+        return [self._ready.popleft() for _ in range(count)]
+
+    def _resolve_cached(self):
+        """Answer queued checks from the hash cache, one query per bucket and stage"""
+        # Cache hits are placed straight away and may queue further checks
+        while self._backlog:
+            buckets = defaultdict(list)
+            while self._backlog:
+                record, key = self._backlog.popleft()
+                buckets[(record.dev, record.size, len(key) - 2)].append((record, key))
+
+            for (dev, size, level), tasks in buckets.items():
+                stage = self._stage_id(dev, size, level)
+                found = self.cache.lookup_bucket(
+                    dev, size, self.algorithm, stage,
+                    [(record.ino, record.mtime_ns, record.path) for record, key in tasks]
+                )
+                for record, key in tasks:
+                    digest = found.get(record.ino)
+                    if digest is None:
+                        self._make_ready((record, key))
+                    else:
+                        self.cached += 1
+                        self.checked += 1
+                        self._place(record, key + (digest,))
+
+    def _release_walk_slots(self):
+        """Let the walker continue once the hash backlog has room again"""
+        while self._owed_slots and len(self._backlog) + self._queued() < self.queue_size:
+            self._walk_slots.release()
+            self._owed_slots -= 1
+
+    def _add_digests(self, tasks, digests):
+        """Move checked records into the nodes for their new digests"""
+        self._in_flight -= len(tasks)
+        dev = tasks[0][0].dev
+        if self._ordered(dev):
+            self._readers[dev] -= 1
+        for (record, key), digest in zip(tasks, digests):
+            if digest is None:
+                continue
+            if self.cache is not None:
+                stage = self._stage_id(record.dev, record.size, len(key) - 2)
+                self.cache.store(
+                    record.dev, record.ino, record.size, record.mtime_ns,
+                    self.algorithm, stage, digest, record.path
+                )
+            self._place(record, key + (digest,))
+        reported = self.checked // 50
+        self.checked += len(tasks)
+        if self.progress is not None and self.checked // 50 != reported:
+            self.progress(self.checked, self.candidates)
+
+    def _add_compared(self, records, key, matched):
+        """Place the sets that matched to the end, drop files that differed"""
+        self._in_flight -= len(records)
+        self._compare_done(key)
+        self.checked += len(records)
+        placed = set()
+        for indexes, digest in matched:
+            proof = next(self._proof_ids)
+            for index in indexes:
+                placed.add(index)
+                record = records[index]
+                self._proofs[record.inode] = proof
+                if self.cache is not None:
+                    stage = self._stage_id(record.dev, record.size, len(key) - 2)
+                    self.cache.store(
+                        record.dev, record.ino, record.size, record.mtime_ns,
+                        self.algorithm, stage, digest, record.path
+                    )
+                self._place(record, key + (digest,))
+        dropped = [record for index, record in enumerate(records) if index not in placed]
+        if dropped:
+            self._compared_out += len(dropped)
+            if len(self._nodes[key]) > len(records):
+                # Others arrived during the comparison and may match these
+                for record in dropped:
+                    self._compared_out -= 1
+                    self._queue_hash(record, key)
+            else:
+                self._dropped[key] = dropped
+        if self.progress is not None:
+            self.progress(self.checked, self.candidates)
+
+    def _needs_verify(self, node):
+        """Whether a final node's members must be compared byte by byte before linking"""
+        if len(node) < 2:
+            return False
+        if self.algorithm in CRYPTOGRAPHIC_DIGESTS and not any(
+            (record.dev, record.ino) in self._unverified for record in node
+        ):
+            return False
+        # Members of one lockstep set were already compared to the end
+        proof = self._proofs.get(node[0].inode)
+        return proof is None or any(self._proofs.get(record.inode) != proof for record in node)
+
+    def _verify_groups(self):
+        """Start byte comparisons for every final node whose digest match is not proof"""
+        # Digests read from the files' own attributes could have been written by anyone
+        self._unverified = getattr(self.cache, "unverified", None) or set()
+        for key, node in list(self._nodes.items()):
+            if len(key) - 2 >= len(self._stages_for(key[1])) and self._needs_verify(node):
+                self._verify_node(key)
+
+    def _verify_node(self, key):
+        """Compare a node's members against its first file, a few files at a time"""
+        node = self._nodes[key]
+        anchor = node[0]
+        proof = self._proofs.get(anchor.inode)
+        others = [
+            record for record in node[1:]
+            if proof is None or self._proofs.get(record.inode) != proof
+        ]
+        for start in range(0, len(others), VERIFY_FILES - 1):
+            records = [anchor] + others[start:start + VERIFY_FILES - 1]
+            self._verifying[key] = self._verifying.get(key, 0) + 1
+            self._run_compare(records, key, "verified")
+
+    def _add_verified(self, records, key, matched):
+        """Split off the files that differ from their node's first file"""
+        self._in_flight -= len(records)
+        self._compare_done(key)
+        same = {0}
+        for indexes, digest in matched:
+            # Files equal to each other but not to the first file keep their
+            # proof, so their own node needs no second read among them
+            proof = next(self._proof_ids)
+            for index in indexes:
+                self._proofs[records[index].inode] = proof
+            if 0 in indexes:
+                same = set(indexes)
+        node = self._nodes[key]
+        split = self._splits.setdefault(key, [])
+        for index, record in enumerate(records):
+            if index not in same:
+                node.remove(record)
+                split.append(record)
+        self._verifying[key] -= 1
+        if self._verifying[key]:
+            return
+        if len(node) == 1:
+            # The first file has no confirmed duplicate left
+            node.clear()
+            self._verified_out += 1
+        split = self._splits.pop(key)
+        if len(split) == 1:
+            self._verified_out += 1
+        elif split:
+            # The rest may still hold duplicates of one another
+            split_key = key + (next(self._proof_ids),)
+            self._nodes[split_key] = split
+            if self._needs_verify(split):
+                self._verify_node(split_key)
+
+    def _count_cross_device(self):
+        """Count inodes whose size is only matched by files on other devices"""
+        per_size = defaultdict(list)
+        for (dev, size), inodes in self._buckets.items():
+            per_size[size].append(len(inodes))
+        for dev, size in self._lone:
+            per_size[size].append(1)
+        return sum(
+            count
+            for counts in per_size.values() if len(counts) > 1
+            for count in counts if count == 1
+        )
+
+    def _count_eliminated(self):
+        """Count inodes ruled out by each stage, cheapest stage first"""
+        counts = defaultdict(int)
+        for key, node in self._nodes.items():
+            level = len(key) - 2
+            if level and len(node) == 1:
+                name, ranges = self._stages_for(key[1])[level - 1]
+                counts[name] += 1
+        if self._compared_out:
+            counts["lockstep"] += self._compared_out
+        if self._verified_out:
+            counts["verify"] += self._verified_out
+        return {name: counts[name] for name in STAGE_NAMES if name in counts}
+
+    def _collect_groups(self):
+        """Build sorted duplicate groups with one path per distinct inode"""
+        groups = []
+        for key, node in self._nodes.items():
+            dev, size = key[:2]
+            if len(node) < 2 or len(key) - 2 < len(self._stages_for(size)):
+                continue
+            bucket = self._buckets[(dev, size)]
+            groups.append(sorted(min(bucket[record.inode]) for record in node))
+        # Walker and hasher threads finish in any order, keep reports stable
+        groups.sort()
+        return groups
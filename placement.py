@@ -0,0 +1,75 @@
+"""
+HardLinker Disk Placement
+Orders reads by where files sit on the platter
+"""
+
+import bisect
+import itertools
+import struct
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: reads fall back to inode order
+    fcntl = None
+
+# _IOWR('f', 11, struct fiemap)
+FS_IOC_FIEMAP = 0xC020660B
+# struct fiemap header, then struct fiemap_extent entries
+FIEMAP_HEADER = struct.Struct("=QQLLLL")
+FIEMAP_EXTENT = struct.Struct("=QQQQQLLLL")
+
+
+def first_extent_offset(path):
+    """Physical byte offset of a file's first extent, or None if the filesystem won't say"""
+    if fcntl is None:
+        return None
+    request = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+    # fm_start 0, fm_length everything, no flags, room for one extent
+    FIEMAP_HEADER.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, request)
+    except (OSError, ValueError):
+        return None
+    mapped_extents = FIEMAP_HEADER.unpack_from(request, 0)[3]
+    if not mapped_extents:
+        return None
+    return FIEMAP_EXTENT.unpack_from(request, FIEMAP_HEADER.size)[1]
+
+
+def physical_key(record):
+    """Sort key placing a file by physical offset, or by inode when unknown"""
+    # Inode numbers roughly follow allocation order on most filesystems, so
+    # they are a usable stand-in; offsets sort before all inode fallbacks
+    offset = first_extent_offset(record.path)
+    if offset is None:
+        return (1, record.ino)
+    return (0, offset)
+
+
+class Elevator:
+    """Queue of reads on one disk, handed out in one sweep across the platter"""
+
+    def __init__(self):
+        self._items = []
+        self._head = None
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._items)
+
+    def push(self, position, item):
+        """Queue an item at its physical position"""
+        bisect.insort(self._items, (position, next(self._order), item))
+
+    def pop(self):
+        """Next item at or after the current head position, wrapping to the start"""
+        index = 0
+        if self._head is not None:
+            index = bisect.bisect_left(self._items, (self._head,))
+            if index == len(self._items):
+                index = 0
+        position, order, item = self._items.pop(index)
+        self._head = position
+        return item
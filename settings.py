@@ -8,17 +8,61 @@ import os
 import sys
 
 SETTINGS_FILE = "hardlinker_settings.json"
+HASH_CACHE_FILE = "hardlinker_cache.sqlite"
+LINK_JOURNAL_FILE = "hardlinker_journal.jsonl"
 
-def get_settings_path():
-    """Get the full path to settings file"""
+# Scan and link tuning, overridable under "options" in the settings file
+DEFAULT_OPTIONS = {
+    "walker_threads": 8,
+    "hash_threads": 0,  # 0 uses one worker per CPU core
+    "hash_backend": "thread",  # "thread" or "process"
+    "hash_batch_size": 32,
+    "hash_algorithm": "sha256",
+    "mmap_threshold": 64 * 1024 * 1024,  # 0 never maps files
+    "hash_cache": True,
+    "hash_cache_max_entries": 2000000,
+    "xattr_cache": False,  # also keep digests in user.hardlinker.* attributes (Linux)
+    "prehash_head_bytes": 16384,
+    "prehash_tail_bytes": 16384,
+    "prehash_middle_samples": 3,
+    "prehash_middle_bytes": 16384,
+    "lockstep": True,  # compare the first pair of a size byte by byte instead of hashing it
+    "lockstep_min_size": 1024 * 1024,
+    "hdd_mode": "auto",  # "auto" orders reads on spinning disks, "on" or "off" forces it
+    "hdd_readers_per_disk": 1,
+    "read_cache_policy": "normal",  # "normal", "dontneed" or "direct"
+    "throttle_bytes_per_second": 0,  # 0 is unlimited
+    "throttle_files_per_second": 0,  # 0 is unlimited
+    "worker_nice": 0,
+    "worker_io_priority": "normal",  # "normal", "low" or "idle"
+    "link_workers": 8,
+    "link_durability": "batched",  # "none", "batched" or "strict"
+    "link_sync_every": 256,
+    "tree_hash_threshold": 1024 * 1024 * 1024,  # 0 always hashes files as one stream
+    "tree_segment_size": 64 * 1024 * 1024,
+    "tree_hash_threads": 0,  # 0 uses one thread per CPU core
+}
+
+def get_app_dir():
+    """Get the folder that holds settings and other program data"""
     # PyInstaller creates a temp folder and stores path in _MEIPASS
     if getattr(sys, 'frozen', False):
         # Running as compiled exe - save settings next to exe
-        app_dir = os.path.dirname(sys.executable)
-    else:
-        # Running as script - save in script directory
-        app_dir = os.path.dirname(os.path.abspath(__file__))
-    return os.path.join(app_dir, SETTINGS_FILE)
+        return os.path.dirname(sys.executable)
+    # Running as script - save in script directory
+    return os.path.dirname(os.path.abspath(__file__))
+
+def get_settings_path():
+    """Get the full path to settings file"""
+    return os.path.join(get_app_dir(), SETTINGS_FILE)
+
+def get_hash_cache_path():
+    """Get the full path to the hash cache database"""
+    return os.path.join(get_app_dir(), HASH_CACHE_FILE)
+
+def get_link_journal_path():
+    """Get the full path to the link run journal"""
+    return os.path.join(get_app_dir(), LINK_JOURNAL_FILE)
 
 def load_settings():
     """Load settings from file"""
@@ -64,3 +108,15 @@ def set_show_admin_warning(show):
     settings = load_settings()
     settings["show_admin_warning"] = show
     save_settings(settings)
+
+def get_options():
+    """Get scan and link options merged over the defaults"""
+    options = dict(DEFAULT_OPTIONS)
+    options.update(load_settings().get("options", {}))
+    return options
+
+def set_option(name, value):
+    """Set a single scan or link option"""
+    settings = load_settings()
+    settings.setdefault("options", {})[name] = value
+    save_settings(settings)
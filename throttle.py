@@ -0,0 +1,126 @@
+"""
+HardLinker Throttling
+Rate limits and lower priorities for scans on busy machines
+"""
+
+import ctypes
+import os
+import platform
+import sys
+import threading
+import time
+
+from control import MP_CONTEXT
+
+# ioprio_set(2) syscall numbers by architecture
+IOPRIO_SYSCALLS = {"x86_64": 251, "i386": 289, "i686": 289, "aarch64": 30, "armv7l": 314}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+# Priority name to (I/O class, level): best-effort lowest, or idle
+IO_PRIORITIES = {"low": (2, 7), "idle": (3, 0)}
+
+# Windows: background mode also lowers the thread's I/O and memory priority
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+
+
+class TokenBucket:
+    """Token bucket shared by threads and worker processes, adjustable while in use"""
+
+    def __init__(self, rate=0):
+        # rate, tokens, last refill time; shared memory so worker processes
+        # inherit it and see limit changes made by the GUI
+        self._state = MP_CONTEXT.Array("d", [0.0, 0.0, time.monotonic()])
+        self.set_rate(rate)
+
+    @property
+    def rate(self):
+        """Tokens per second, 0 meaning unlimited"""
+        return self._state[0]
+
+    def set_rate(self, rate):
+        """Change the rate, taking effect for calls already waiting"""
+        with self._state.get_lock():
+            self._state[0] = max(0.0, float(rate or 0))
+            # At most one second of burst under the new rate
+            self._state[1] = min(self._state[1], self._state[0])
+
+    def acquire(self, amount, cancel_check=None):
+        """Wait until amount tokens are available, or return early if cancelled"""
+        while True:
+            with self._state.get_lock():
+                rate, tokens, stamp = self._state[:]
+                if rate <= 0:
+                    return
+                now = time.monotonic()
+                tokens = min(rate, tokens + (now - stamp) * rate)
+                self._state[2] = now
+                # Requests larger than the burst go into debt instead of
+                # waiting forever; the next caller pays it off
+                if tokens >= min(amount, rate):
+                    self._state[1] = tokens - amount
+                    return
+                self._state[1] = tokens
+                wait = (min(amount, rate) - tokens) / rate
+            if cancel_check is not None and cancel_check():
+                return
+            # Short sleeps pick up rate changes and cancellation promptly
+            time.sleep(min(wait, 0.1))
+
+
+class Throttle:
+    """Bytes-read and files-opened limits for one scan or link run"""
+
+    def __init__(self, bytes_per_second=0, files_per_second=0):
+        self.bytes = TokenBucket(bytes_per_second)
+        self.files = TokenBucket(files_per_second)
+
+    def set_limits(self, bytes_per_second=None, files_per_second=None):
+        """Change either limit while the scan is running, 0 for unlimited"""
+        if bytes_per_second is not None:
+            self.bytes.set_rate(bytes_per_second)
+        if files_per_second is not None:
+            self.files.set_rate(files_per_second)
+
+    def read(self, count, cancel_check=None):
+        """Account for count bytes read"""
+        self.bytes.acquire(count, cancel_check)
+
+    def open_file(self, cancel_check=None):
+        """Account for one file opened or linked"""
+        self.files.acquire(1, cancel_check)
+
+
+def _set_io_priority(io_priority):
+    """Lower the I/O priority of the calling thread on Linux"""
+    number = IOPRIO_SYSCALLS.get(platform.machine())
+    if number is None:
+        return
+    io_class, level = IO_PRIORITIES[io_priority]
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.syscall(
+            number, IOPRIO_WHO_PROCESS, threading.get_native_id(),
+            (io_class << IOPRIO_CLASS_SHIFT) | level
+        )
+    except (OSError, AttributeError):
+        pass
+
+
+def lower_priority(nice=0, io_priority="normal"):
+    """Lower the CPU and I/O priority of the calling thread, where the platform allows"""
+    if sys.platform == "win32":
+        if nice > 0 or io_priority != "normal":
+            try:
+                kernel32 = ctypes.windll.kernel32
+                kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+            except (OSError, AttributeError):
+                pass
+        return
+    if nice > 0:
+        try:
+            # On Linux the "process" id of setpriority may be a thread id
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), min(int(nice), 19))
+        except (OSError, AttributeError):
+            pass
+    if io_priority in IO_PRIORITIES and sys.platform.startswith("linux"):
+        _set_io_priority(io_priority)
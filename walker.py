@@ -0,0 +1,170 @@
+"""
+HardLinker Directory Walker
+Collects file records with a single stat per entry
+"""
+
+import os
+import queue
+import threading
+from collections import deque
+from typing import NamedTuple
+
+
+class FileRecord(NamedTuple):
+    """Stat data collected once per file and carried through the scan"""
+    path: str
+    size: int
+    dev: int
+    ino: int
+    mtime_ns: int
+    nlink: int
+
+    @property
+    def inode(self):
+        """Identity of the file data on disk"""
+        return (self.dev, self.ino)
+
+
+def record_from_entry(entry):
+    """Build a FileRecord from a DirEntry, or None if it is not a regular file"""
+    if not entry.is_file():
+        return None
+    st = entry.stat()
+    return FileRecord(entry.path, st.st_size, st.st_dev, st.st_ino, st.st_mtime_ns, st.st_nlink)
+
+
+def with_identity(record):
+    """Fill in dev/ino/nlink when the DirEntry left them empty"""
+    # On Windows DirEntry.stat() reports st_ino, st_dev and st_nlink as zero,
+    # so they are only looked up for files that actually become candidates
+    if record.ino:
+        return record
+    st = os.stat(record.path)
+    return record._replace(dev=st.st_dev, ino=st.st_ino, nlink=st.st_nlink)
+
+
+def scan_directory(path):
+    """List one directory, returning (file records, subdirectory paths)"""
+    records = []
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                    continue
+                record = record_from_entry(entry)
+            except OSError:
+                continue
+            if record is not None:
+                records.append(record)
+    return records, subdirs
+
+
+def walk_files(top, cancel_check=None):
+    """Yield a FileRecord for every regular file under top"""
+    stack = [top]
+    while stack:
+        if cancel_check is not None and cancel_check():
+            return
+        path = stack.pop()
+        try:
+            records, subdirs = scan_directory(path)
+        except OSError:
+            continue
+        yield from records
+        stack.extend(reversed(subdirs))
+
+
+class ParallelWalker:
+    """Walk a tree with a pool of threads that steal directories from each other"""
+
+    def __init__(self, workers=8, cancel_check=None, max_batches=256):
+        self.workers = max(1, int(workers))
+        self.cancel_check = cancel_check
+        self.max_batches = max_batches
+
+    def walk(self, top):
+        """Yield a FileRecord for every regular file under top, in no fixed order"""
+        self._queues = [deque() for _ in range(self.workers)]
+        self._queues[0].append(top)
+        self._pending = 1
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._results = queue.Queue(maxsize=self.max_batches)
+
+        threads = [
+            threading.Thread(target=self._worker, args=(index,), daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        finished = 0
+        try:
+            while finished < self.workers:
+                batch = self._results.get()
+                if batch is None:
+                    finished += 1
+                    continue
+                yield from batch
+        finally:
+            # Consumer stopped early: release workers blocked on the full queue
+            self._stop()
+            while finished < self.workers:
+                if self._results.get() is None:
+                    finished += 1
+
+    def _stop(self):
+        """Tell every worker to exit after its current directory"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _next_directory(self, index):
+        """Pop from our own queue, or steal the oldest entry from another worker"""
+        try:
+            # Newest first keeps each worker depth-first in its own subtree
+            return self._queues[index].pop()
+        except IndexError:
+            pass
+        for offset in range(1, self.workers):
+            victim = self._queues[(index + offset) % self.workers]
+            try:
+                # Oldest entries sit closest to the root and carry the most work
+                return victim.popleft()
+            except IndexError:
+                continue
+        return None
+
+    def _worker(self, index):
+        """Scan directories until the whole tree is done or the walk is stopped"""
+        try:
+            while True:
+                if self.cancel_check is not None and self.cancel_check():
+                    self._stop()
+                path = self._next_directory(index) if not self._stopped else None
+                if path is None:
+                    with self._cond:
+                        if self._stopped or self._pending == 0:
+                            return
+                        self._cond.wait(0.05)
+                    continue
+
+                try:
+                    records, subdirs = scan_directory(path)
+                except OSError:
+                    records, subdirs = [], []
+
+                with self._cond:
+                    # Children are counted in the same step that retires this
+                    # directory, so pending never touches zero while work remains
+                    self._pending += len(subdirs) - 1
+                    self._queues[index].extend(subdirs)
+                    if subdirs or self._pending == 0:
+                        self._cond.notify_all()
+
+                if records:
+                    self._results.put(records)
+        finally:
+            self._results.put(None)
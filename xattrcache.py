@@ -0,0 +1,134 @@
+"""
+HardLinker Extended Attribute Cache
+Digests stored on the files themselves, so any machine mounting them can reuse them
+"""
+
+import argparse
+import errno
+import os
+import struct
+import sys
+
+from walker import walk_files
+
+XATTR_PREFIX = "user.hardlinker."
+# Format version, size, mtime_ns, then the digest
+XATTR_HEADER = struct.Struct("<BQq")
+XATTR_VERSION = 1
+
+# errno values meaning the filesystem (or the platform) has no user xattrs
+UNSUPPORTED = {errno.ENOTSUP, getattr(errno, "EOPNOTSUPP", errno.ENOTSUP), errno.ENOSYS}
+
+
+def xattr_name(algorithm, stage):
+    """Attribute holding the digest of one algorithm and stage check"""
+    return f"{XATTR_PREFIX}{algorithm}.{stage}"
+
+
+class XattrCache:
+    """Digest cache in user.hardlinker.* extended attributes, validated against stat data"""
+
+    def __init__(self):
+        self.hits = 0
+        # Anyone able to write a file can write its attributes, so digests
+        # read back are only a hint until the file is compared byte by byte
+        self.unverified = set()
+        self._unsupported = set()
+
+    def _usable(self, dev, stage):
+        """Whether digests for this device and stage live in xattrs"""
+        # Sampled checks are cheap to redo; only whole-file digests are worth
+        # an attribute write on every candidate
+        return stage.startswith("full") and dev not in self._unsupported
+
+    def lookup_bucket(self, dev, size, algorithm, stage, files):
+        """Return {ino: digest} for the (ino, mtime_ns, path) files whose attribute still matches"""
+        found = {}
+        if not self._usable(dev, stage):
+            return found
+        name = xattr_name(algorithm, stage)
+        for ino, mtime_ns, path in files:
+            try:
+                value = os.getxattr(path, name)
+            except OSError as e:
+                if e.errno in UNSUPPORTED:
+                    self._unsupported.add(dev)
+                    break
+                continue
+            if len(value) <= XATTR_HEADER.size:
+                continue
+            version, cached_size, cached_mtime_ns = XATTR_HEADER.unpack_from(value)
+            # Written by another version, or the file changed since
+            if version == XATTR_VERSION and cached_size == size and cached_mtime_ns == mtime_ns:
+                found[ino] = value[XATTR_HEADER.size:]
+        self.hits += len(found)
+        self.unverified.update((dev, ino) for ino in found)
+        return found
+
+    def store(self, dev, ino, size, mtime_ns, algorithm, stage, digest, path=None):
+        """Write a digest to the file's attribute, silently skipping files that refuse it"""
+        if path is None or not self._usable(dev, stage):
+            return
+        value = XATTR_HEADER.pack(XATTR_VERSION, size, mtime_ns) + digest
+        try:
+            os.setxattr(path, xattr_name(algorithm, stage), value)
+        except OSError as e:
+            # Read-only files and foreign owners are skipped one by one,
+            # a filesystem without xattrs once per device
+            if e.errno in UNSUPPORTED:
+                self._unsupported.add(dev)
+
+    def flush(self):
+        """Attributes are written straight away, nothing to flush"""
+
+    def close(self):
+        """Nothing to release"""
+
+
+def open_xattr_cache():
+    """Create the xattr cache, or return None where the platform has no xattr calls"""
+    if not hasattr(os, "setxattr"):
+        return None
+    return XattrCache()
+
+
+def strip_xattrs(top, cancel_check=None):
+    """Remove every user.hardlinker.* attribute under top, returning (files, attributes) changed"""
+    files = removed = 0
+    for record in walk_files(top, cancel_check):
+        try:
+            names = [
+                name for name in os.listxattr(record.path, follow_symlinks=False)
+                if name.startswith(XATTR_PREFIX)
+            ]
+        except OSError:
+            continue
+        for name in names:
+            try:
+                os.removexattr(record.path, name, follow_symlinks=False)
+                removed += 1
+            except OSError:
+                pass
+        if names:
+            files += 1
+    return files, removed
+
+
+def main():
+    """Command line entry point for maintenance commands"""
+    parser = argparse.ArgumentParser(description="HardLinker xattr digest cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+    strip = commands.add_parser("strip", help="remove all user.hardlinker.* attributes")
+    strip.add_argument("folder")
+    args = parser.parse_args()
+
+    if not hasattr(os, "removexattr"):
+        print("❌ Extended attributes are not supported on this platform")
+        return 1
+    files, removed = strip_xattrs(args.folder)
+    print(f"✅ Removed {removed} attributes from {files} files")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())